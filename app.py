@@ -1,8 +1,23 @@
 import streamlit as st
-from dataclasses import dataclass
-from typing import List, Optional
-from datetime import datetime
-import textwrap
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+import atexit
+import os
+import secrets
+import time
+
+from preconsulta import (
+    PACIENTES, REAL_CLOCK, CheckpointStore, Clock, Condition, Patient, Profiler, Script, load_scripts,
+)
+from preconsulta.batch import load_patients
+from preconsulta.catalog import Catalog
+from preconsulta.checkpoint import DEFAULT_PATH as CHECKPOINT_PATH
+from preconsulta.events import DEFAULT_PATH as EVENTS_PATH, EventLog
+from preconsulta.search import Hit, LogFollower, TranscriptIndex
+from preconsulta.records import DEFAULT_DB as EHR_DB, RecordStore
+from preconsulta.state import TOKEN_RE
+from preconsulta.profiler import SPANS_DIR, breakdown, spans_path
 
 st.set_page_config(
     page_title="Agente de Preconsulta",
@@ -23,43 +38,188 @@ DEFAULTS = dict(
     radius="Large",                  # Small / Medium / Large
     contrast=0.08,                   # 0 - 0.18
     anim_on=True,
+    client_typing=True,              # anima en el navegador (sin round-trips)
     agent_typing_speed=0.018,
     patient_thinking_delay=1.0,
     patient_typing_speed=0.022,
     show_timestamps=True,
     notes="",
+    transcript_html="",              # turnos emitidos, renderizados una sola vez
+    transcript_turns=0,
+    replay_speed=1,                  # multiplicador de ritmo (repaso rápido)
+    live_mode=False,                 # el paciente escribe sus respuestas
+    live_answers=[],
+    completed={},                    # "pid:cid" → respuestas libres (o None si fue guiada)
     convo_enabled=False,             # lo activa la Parte 2
+    profile_on=False,                # perfilado opt-in por rerun
+    profile_sink="",                 # nombre .jsonl o .json (Chrome trace) en SPANS_DIR
 )
 for k, v in DEFAULTS.items():
     if k not in st.session_state:
         st.session_state[k] = v
 
-# Datos
-@dataclass
-class Patient:
-    pid: str
-    nombre: str
-    edad: int
-    sexo: str
-    condicion_base: str
-
-@dataclass
-class Condition:
-    cid: str
-    titulo: str
-    descripcion: str
-
-PACIENTES: List[Patient] = [
-    Patient("nvelarde", "Nicolás Velarde", 34, "Masculino", "Trastorno de ansiedad"),
-    Patient("aduarte",   "Amalia Duarte",   62, "Femenino",  "Diabetes tipo 2"),
-    Patient("szamora",   "Sofía Zamora",    23, "Femenino",  "Asma"),
-]
-CONDICIONES: List[Condition] = [
-    Condition("flu", "Gripe", "Fiebre, mialgia, congestión y fatiga."),
-    Condition("mal", "Malaria", "Fiebre intermitente; antecedente de viaje a zona endémica."),
-    Condition("mig", "Migraña", "Cefalea pulsátil lateralizada con foto/fonofobia, náusea."),
-    Condition("ss",  "Síndrome serotoninérgico", "Exceso de serotonina (p. ej., ISRS + dextrometorfano)."),
-]
+def clock() -> Clock:
+    # Ritmo y horas de los mensajes; pruebas y benchmark inyectan un VirtualClock
+    return st.session_state.get("_clock", REAL_CLOCK)
+
+# Perfilado: spans por rerun (se cierra al final de la Parte 2)
+if "_profiler" not in st.session_state:
+    st.session_state["_profiler"] = Profiler()
+prof: Profiler = st.session_state["_profiler"]
+prof.enabled = st.session_state.profile_on
+try:
+    prof.sink = spans_path(st.session_state.profile_sink) if st.session_state.profile_sink else ""
+    sink_error = ""
+except ValueError as exc:
+    prof.sink, sink_error = "", str(exc)
+prof.begin("app")
+
+# Datos: guiones compilados una vez por proceso, compartidos entre sesiones
+SCRIPTS: Dict[str, Script] = st.cache_resource(load_scripts)()
+CONDICIONES: List[Condition] = [sc.condition for sc in SCRIPTS.values()]
+
+# Catálogos indexados por id; el roster puede venir de un CSV/JSON grande
+# (PRECONSULTA_PACIENTES) y la vista sólo pinta una página.
+@st.cache_resource
+def patient_catalog(path: str) -> Catalog[Patient]:
+    roster = load_patients(path) if path else PACIENTES
+    return Catalog(roster, key=lambda p: p.pid, text=lambda p: f"{p.nombre} {p.condicion_base}")
+
+@st.cache_resource
+def condition_catalog() -> Catalog[Condition]:
+    return Catalog(CONDICIONES, key=lambda c: c.cid, text=lambda c: f"{c.titulo} {c.descripcion}")
+
+# Expediente por paciente (python -m preconsulta.records); sin él, EHR genérico
+@st.cache_resource
+def record_store(path: str) -> Optional[RecordStore]:
+    return RecordStore(path) if path and os.path.exists(path) else None
+
+RECORDS = record_store(os.environ.get("PRECONSULTA_EHR", EHR_DB))
+CAT_PACIENTES = patient_catalog(os.environ.get("PRECONSULTA_PACIENTES", ""))
+CAT_CONDICIONES = condition_catalog()
+
+# Checkpoint de la sesión en SQLite, con token reanudable en la URL (?s=...).
+# Un refresh o una reconexión retoma en el último turno, sin re-animar.
+CHECKPOINT_KEYS = ("step", "sel_patient", "sel_condition", "chat_idx", "pause", "notes",
+                   "live_mode", "live_answers", "completed")
+
+@st.cache_resource
+def checkpoint_store() -> Optional[CheckpointStore]:
+    # Ruta SQLite, file://carpeta o redis://...; compartirla entre procesos
+    # permite que cualquier worker del balanceador retome la sesión.
+    url = os.environ.get("PRECONSULTA_CHECKPOINTS", CHECKPOINT_PATH)
+    if not url:                                 # vacío → sin checkpoints
+        return None
+    store = CheckpointStore.open(url)
+    atexit.register(store.close)
+    return store
+
+def session_token() -> str:
+    token = st.query_params.get("s")
+    if not token or not TOKEN_RE.match(token):
+        token = secrets.token_urlsafe(12)
+        st.query_params["s"] = token
+    return token
+
+def checkpoint_state() -> Dict[str, object]:
+    # Copia de listas y dicts: el estado guardado no debe cambiar con la sesión
+    return {k: list(v) if isinstance(v, list) else dict(v) if isinstance(v, dict) else v
+            for k, v in ((k, st.session_state[k]) for k in CHECKPOINT_KEYS)}
+
+def restore_session(state: Dict[str, object]):
+    # Se descarta un checkpoint que ya no encaja con pacientes/guiones actuales
+    step, pid, cid = state.get("step"), state.get("sel_patient"), state.get("sel_condition")
+    if step not in ("select", "intro", "convo", "analytics"):
+        return
+    if pid is not None and pid not in CAT_PACIENTES:
+        return
+    if cid is not None and cid not in SCRIPTS:
+        return
+    if step != "select" and (pid is None or cid is None):
+        return
+    if not all(isinstance(a, str) for a in state.get("live_answers", [])):
+        return
+    if not isinstance(state.get("completed", {}), dict):
+        return
+    for k in CHECKPOINT_KEYS:
+        if k in state:
+            st.session_state[k] = state[k]
+    if cid is not None:
+        last = len(SCRIPTS[cid].chat) - 1
+        st.session_state.chat_idx = max(-1, min(int(st.session_state.chat_idx), last))
+    # Entrevistas terminadas cuyo paciente o guion ya no existe: se omiten
+    st.session_state.completed = {
+        k: v for k, v in st.session_state.completed.items()
+        if k.rpartition(":")[0] in CAT_PACIENTES and k.rpartition(":")[2] in SCRIPTS
+        and (v is None or (isinstance(v, list) and all(isinstance(a, str) for a in v)))
+    }
+    st.session_state["_resume_seek"] = step == "convo"
+
+def checkpoint_session():
+    # Sólo se encola si algo cambió; el hilo del store escribe en lote
+    store = checkpoint_store()
+    if store is None:
+        return
+    state = checkpoint_state()
+    if state != st.session_state.get("_checkpointed"):
+        store.save(st.session_state["_token"], state)
+        st.session_state["_checkpointed"] = state
+
+# Bitácora de auditoría (PRECONSULTA_EVENTS: .jsonl o .sqlite3; vacío la
+# desactiva). emit() sólo encola; un hilo escribe en lote.
+def events_url() -> str:
+    return os.environ.get("PRECONSULTA_EVENTS", EVENTS_PATH)
+
+@st.cache_resource
+def event_log() -> Optional[EventLog]:
+    url = events_url()
+    if not url:
+        return None
+    log = EventLog.open(url)
+    atexit.register(log.close)
+    return log
+
+# Índice de texto completo de las entrevistas: se alimenta al emitir cada
+# turno y, antes de cada búsqueda, con lo que la bitácora sumó desde la última
+# (incluidas sesiones de otros procesos y de corridas anteriores).
+def script_turn(cid: str, idx: int) -> Optional[str]:
+    sc = SCRIPTS.get(cid)
+    return sc.chat[idx][1] if sc is not None and 0 <= idx < len(sc.chat) else None
+
+@st.cache_resource
+def transcript_index() -> TranscriptIndex:
+    return TranscriptIndex(resolve=script_turn)
+
+@st.cache_resource
+def log_follower() -> Optional[LogFollower]:
+    url = events_url()
+    return LogFollower(transcript_index(), url) if url else None
+
+SEARCH_SHOWN = 12      # entrevistas listadas
+SEARCH_LIMIT = 2000    # coincidencias por consulta
+
+def session_id() -> str:
+    # El token de checkpoint si lo hay; si no, uno propio de la sesión
+    if "_token" in st.session_state:
+        return st.session_state["_token"]
+    return st.session_state.setdefault("_sid", secrets.token_urlsafe(12))
+
+def log_event(kind: str, **data: object):
+    log = event_log()
+    if log is not None:
+        log.emit(session_id(), kind, data, at=clock().now())
+
+def log_events(events: List[Tuple[str, Dict[str, object]]]):
+    log = event_log()
+    if log is not None and events:
+        log.emit_many(session_id(), events, at=clock().now())
+
+if checkpoint_store() is not None and "_token" not in st.session_state:
+    st.session_state["_token"] = session_token()
+    saved = checkpoint_store().load(st.session_state["_token"])
+    if saved:
+        restore_session(saved)
+    st.session_state["_checkpointed"] = checkpoint_state()
 
 # Paletas profesionales
 THEMES = {
@@ -99,14 +259,22 @@ def _density_tokens(mode: str):
         return ("1.0rem","1.6rem", "18px", "16px")
     return ("0.6rem","1.0rem", "14px", "12px")  # Normal
 
+# Servida por Streamlit desde static/ (server.enableStaticServing)
+STYLESHEET_URL = "app/static/preconsulta.css"
+
 def inject_css():
-    t = THEMES[st.session_state.theme_name]
-    pad_top, pad_bottom, pad_card, pad_btn = _density_tokens(st.session_state.density)
-    radius = _radius_token(st.session_state.radius)
-    contrast = st.session_state.contrast
-    st.markdown(
-        f"""
-<style>
+    with prof.span("inject_css"):
+        _inject_css()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def theme_css(theme_name: str, density: str, radius_size: str, contrast: float) -> str:
+    # Bloque mínimo por sesión: sólo variables CSS, memoizado por su clave.
+    # Las reglas viven en static/preconsulta.css (cacheable por el navegador).
+    t = THEMES[theme_name]
+    pad_top, pad_bottom, pad_card, pad_btn = _density_tokens(density)
+    radius = _radius_token(radius_size)
+    return f"""<style>
+@import url("{STYLESHEET_URL}");
 :root {{
   --bg-top: {t['bg_top']};
   --bg-mid: {t['bg_mid']};
@@ -118,402 +286,332 @@ def inject_css():
   --accent: {t['accent']};
   --grad-a: {t['grad_a']};
   --radius: {radius};
+  --pad-top: {pad_top};
+  --pad-bottom: {pad_bottom};
   --pad-card: {pad_card};
   --pad-btn: {pad_btn};
-  --elev-1: 0 8px 26px rgba(0,0,0,{0.16+contrast});
-  --elev-2: 0 12px 36px rgba(0,0,0,{0.22+contrast});
+  --elev-1: 0 8px 26px rgba(0,0,0,{0.16+contrast:.2f});
+  --elev-2: 0 12px 36px rgba(0,0,0,{0.22+contrast:.2f});
   --line: 1px solid {t['border']};
 }}
-html, body, [class*="css"] {{
-  background: radial-gradient(80% 100% at 50% 0%, var(--bg-top) 0%, var(--bg-mid) 60%, var(--bg-mid) 100%) !important;
-  color: var(--text) !important;
-  font-family: Inter, system-ui, -apple-system, Segoe UI, Roboto, Helvetica Neue, Arial, sans-serif;
-  font-size: 16px; line-height: 1.38;
-}}
-header {{ visibility: hidden; }}
-.block-container {{ padding-top: {pad_top}; padding-bottom: {pad_bottom}; max-width: 1200px; }}
-section.main > div {{ padding-top: 0 !important; }}
-
-.topbar {{
-  position: sticky; top: 0; z-index: 30;
-  display: flex; align-items: center; justify-content: space-between; gap: 12px;
-  background: color-mix(in oklab, var(--bg-card) 86%, #000 14%);
-  border: var(--line); border-radius: var(--radius);
-  padding: 10px 14px; box-shadow: var(--elev-1);
-}}
-.brand {{ display:flex; align-items:center; gap:10px; font-weight:900; letter-spacing:.2px; }}
-.brand-badge {{
-  width: 36px; height: 36px; border-radius: 12px;
-  background: var(--grad-a);
-  box-shadow: inset 0 0 0 4px rgba(255,255,255,.06), 0 0 0 1px rgba(255,255,255,.06), var(--elev-1);
-}}
-.kpis {{ display:flex; gap:8px; flex-wrap:wrap; align-items:center; }}
-.badge {{
-  display:inline-flex; align-items:center; gap:6px; border-radius: 999px; padding: 6px 10px;
-  background: color-mix(in oklab, var(--bg-card) 92%, #fff 8%);
-  color: var(--text); border: var(--line); font-weight: 800; font-size: .82rem;
-}}
-
-.stepper {{ display:flex; gap:8px; align-items:center; flex-wrap:wrap; margin-top: 6px; }}
-.step {{
-  padding:8px 12px; border-radius: 12px; border: var(--line); background: var(--bg-card);
-  font-weight:800; font-size:.86rem; position:relative; overflow:hidden; transition: transform .12s ease, box-shadow .12s ease;
-}}
-.step::before {{
-  content:""; position:absolute; inset:auto auto 0 0; height:3px; width:100%;
-  background: var(--grad-a); opacity:.35;
-}}
-.step.active {{ box-shadow: inset 0 0 0 3px rgba(255,255,255,.04), var(--elev-1); transform: translateY(-1px); border-color: #3b82f633; }}
-.dot {{ width:7px; height:7px; border-radius:999px; background: var(--muted); opacity:.6; }}
-
-.sep {{
-  height: 1px; border: none; margin: 10px 0 12px;
-  background: linear-gradient(90deg, transparent, color-mix(in oklab, var(--primary) 70%, var(--accent) 30%), transparent);
-}}
-
-.h-title {{ font-weight:900; font-size: clamp(1.2rem, 1.1rem + 0.6vw, 1.6rem); margin:0 0 4px; letter-spacing:.15px; }}
-.h-sub {{ color: var(--muted); font-weight: 600; margin-bottom: 2px; }}
-
-.card {{
-  background: color-mix(in oklab, var(--bg-card) 96%, #000 4%);
-  border: var(--line); border-radius: var(--radius); padding: var(--pad-card);
-  box-shadow: var(--elev-1);
-}}
-.soft {{ background: color-mix(in oklab, var(--bg-card) 88%, #fff 12%); }}
+</style>"""
 
-.select-card {{
-  position:relative; border-radius: calc(var(--radius) + 2px);
-  border: 2px solid transparent; cursor: pointer;
-  background: linear-gradient(var(--bg-card), var(--bg-card)) padding-box, var(--grad-a) border-box;
-  transition: transform .12s ease, box-shadow .12s ease;
-}}
-.select-card:hover {{ transform: translateY(-1px); box-shadow: var(--elev-2); }}
-.select-card.selected {{ box-shadow: inset 0 0 0 4px #ffffff14, var(--elev-2); }}
+def _inject_css():
+    css = theme_css(st.session_state.theme_name, st.session_state.density,
+                    st.session_state.radius, st.session_state.contrast)
+    st.html(css)
 
-.card-title {{ font-weight:800; font-size: 1.02rem; margin: 6px 0 2px; }
-.card-sub {{ color: var(--muted); font-size:.92rem; }
+# Render: cada tarjeta o panel se arma como un solo string HTML y se emite
+# como un único elemento (menos deltas por rerun y menos reflow).
+def html(*parts: str):
+    st.markdown("".join(parts), unsafe_allow_html=True)
 
-.ph-img {{
-  height: 120px; border-radius: calc(var(--radius) - 2px); display:flex; align-items:center; justify-content:center;
-  background: repeating-linear-gradient(135deg, rgba(255,255,255,.06) 0 10px, rgba(255,255,255,.02) 10px 20px);
-  border: 1px dashed color-mix(in oklab, var(--border) 80%, #fff 20%); color: var(--muted);
-}}
+def title_html(txt: str, sub: str = "") -> str:
+    return f"<div class='h-title'>{txt}</div>" + (f"<div class='h-sub'>{sub}</div>" if sub else "")
 
-.kit-chips { display:flex; gap:6px; flex-wrap:wrap; }
-.chip {
-  display:inline-flex; align-items:center; gap:6px; padding:5px 9px; border-radius: 999px;
-  background: color-mix(in oklab, var(--bg-card) 94%, #fff 6%);
-  border: var(--line); font-weight: 800; font-size: .80rem;
-}
+def chips_html(chips: Optional[List[str]], style: str = "") -> str:
+    if not chips:
+        return ""
+    attr = f" style='{style}'" if style else ""
+    return f"<div class='kit-chips'{attr}>" + "".join(f"<span class='chip'>{c}</span>" for c in chips) + "</div>"
 
-.grid { display:grid; gap:12px; grid-template-columns: repeat(12, 1fr); }
-.col-12{ grid-column: span 12; } .col-10{ grid-column: span 10; } .col-8{ grid-column: span 8; }
-.col-6{ grid-column: span 6; }  .col-4{ grid-column: span 4; }  .col-3{ grid-column: span 3; }
-@media (max-width:1200px){ .col-6{grid-column:span 12} .col-4{grid-column:span 6} .col-3{grid-column:span 6} }
+def list_html(items: List[str], ordered: bool = False) -> str:
+    tag = "ol" if ordered else "ul"
+    return f"<{tag}>" + "".join(f"<li>{x}</li>" for x in items) + f"</{tag}>"
 
-.stButton > button{
-  border: none; border-radius: var(--radius); padding: var(--pad-btn) calc(var(--pad-btn) + 6px);
-  font-weight: 900; color: #fff; background: var(--primary); box-shadow: var(--elev-1);
-}
-.stButton > button:hover{ filter:brightness(.97); transform: translateY(-1px); }
-.btn-muted > button{ background: transparent !important; color: var(--muted) !important; border: var(--line) !important; }
+def card_html(inner: str, cls: str = "card", style: str = "") -> str:
+    attr = f" style='{style}'" if style else ""
+    return f"<div class='{cls}'{attr}>{inner}</div>"
 
-.small{ color: var(--muted); font-size: .92rem; }
-
-.wave { height: 12px; margin: 8px 0 10px; background:
-  linear-gradient(90deg, transparent, color-mix(in oklab, var(--primary) 70%, var(--accent) 30%), transparent);
-  border-radius: 999px;
-  opacity: .75;
-}
-
-.chatwrap{ background: var(--bg-card); border: var(--line); border-radius: var(--radius); padding: 10px; }
-.msg{ border-radius: 12px; padding: 8px 10px; margin: 6px 0; max-width: 96%; border: var(--line); }
-.msg.agent{ background: color-mix(in oklab, var(--bg-card) 90%, var(--primary) 10%); }
-.msg.patient{ background: color-mix(in oklab, var(--bg-card) 94%, #fff 6%); }
-.typing{ font-family: ui-monospace, SFMono-Regular, Menlo, Consolas, "Liberation Mono", monospace; }
-
-.footer-note{ opacity:.7; margin:10px 0 6px; text-align:center; color: var(--muted); }
-</style>
-        """,
-        unsafe_allow_html=True,
-    )
+WAVE = "<div class='wave'></div>"
 
 def title(txt: str, sub: str = ""):
-    st.markdown(f"<div class='h-title'>{txt}</div>", unsafe_allow_html=True)
-    if sub:
-        st.markdown(f"<div class='h-sub'>{sub}</div>", unsafe_allow_html=True)
-
-def topbar():
-    now = datetime.now().strftime("%d %b %Y • %H:%M")
-    st.markdown(
-        f"""
-        <div class="topbar">
-          <div class="brand">
-            <div class="brand-badge"></div>
-            <div>Agente de Preconsulta</div>
-          </div>
-          <div class="kpis">
-            <span class="badge">ES • MX</span>
-            <span class="badge">Preconsulta</span>
-            <span class="badge">{now}</span>
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
+    html(title_html(txt, sub))
+
+def header_html(current: str) -> str:
+    now = clock().now().strftime("%d %b %Y • %H:%M")
+    topbar = (
+        "<div class='topbar'>"
+        "<div class='brand'><div class='brand-badge'></div><div>Agente de Preconsulta</div></div>"
+        "<div class='kpis'>"
+        "<span class='badge'>ES • MX</span><span class='badge'>Preconsulta</span>"
+        f"<span class='badge'>{now}</span>"
+        "</div></div>"
     )
-
-def stepper(current: str):
     steps = [("select","Paciente y condición"), ("intro","Introducción"), ("convo","Entrevista y reporte")]
     marks = []
     for key, label in steps:
         cls = "step active" if key == current else "step"
         marks.append(f"<span class='{cls}'>{label}</span>")
         if key != steps[-1][0]: marks.append("<span class='dot'></span>")
-    st.markdown("<div class='stepper'>"+"".join(marks)+"</div>", unsafe_allow_html=True)
+    return topbar + "<div class='stepper'>" + "".join(marks) + "</div><hr class='sep'>"
 
-def info_block(t: str, body: str, chips: Optional[List[str]]=None, soft=False):
-    cls = "card soft" if soft else "card"
-    st.markdown(f'<div class="{cls}">', unsafe_allow_html=True)
-    title(t)
-    if chips:
-        st.markdown("<div class='kit-chips'>"+"".join([f"<span class='chip'>{c}</span>" for c in chips])+"</div>", unsafe_allow_html=True)
-    st.markdown(body)
-    st.markdown("</div>", unsafe_allow_html=True)
+def info_block_html(t: str, items: List[str], chips: Optional[List[str]] = None, soft=False, ordered=False) -> str:
+    return card_html(title_html(t) + chips_html(chips) + list_html(items, ordered), "card soft" if soft else "card")
+
+def info_block(t: str, items: List[str], chips: Optional[List[str]] = None, soft=False, ordered=False):
+    html(info_block_html(t, items, chips, soft, ordered))
 
 def patient_card(p: Patient, selected=False):
     sel = "selected" if selected else ""
-    st.markdown(
-        f"""
-        <div class="select-card {sel}">
-          <div class="ph-img">Imagen del paciente</div>
-          <div class="card-title">{p.nombre}</div>
-          <div class="card-sub">{p.edad} años • {p.sexo}</div>
-          <div class="card-sub">Condición de base: <b>{p.condicion_base}</b></div>
-        </div>
-        """,
-        unsafe_allow_html=True,
+    html(
+        f"<div class='select-card {sel}'>"
+        "<div class='ph-img'>Imagen del paciente</div>"
+        f"<div class='card-title'>{p.nombre}</div>"
+        f"<div class='card-sub'>{p.edad} años • {p.sexo}</div>"
+        f"<div class='card-sub'>Condición de base: <b>{p.condicion_base}</b></div>"
+        "</div>"
     )
 
 def condition_card(c: Condition, selected=False):
     sel = "selected" if selected else ""
-    st.markdown(
-        f"""
-        <div class="select-card {sel}">
-          <div class="card-title">{c.titulo}</div>
-          <div class="card-sub">{c.descripcion}</div>
-          <div class="kit-chips" style="margin-top:6px">
-            <span class="chip">Guía</span>
-            <span class="chip">Entrevista</span>
-            <span class="chip">Hechos útiles</span>
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
+    html(
+        f"<div class='select-card {sel}'>"
+        f"<div class='card-title'>{c.titulo}</div>"
+        f"<div class='card-sub'>{c.descripcion}</div>"
+        + chips_html(["Guía", "Entrevista", "Hechos útiles"], "margin-top:6px")
+        + "</div>"
     )
 
-# Sidebar (profesional y breve)
-st.sidebar.subheader("Apariencia")
-theme_choice = st.sidebar.selectbox("Tema", list(THEMES.keys()), index=list(THEMES.keys()).index(st.session_state.theme_name))
-if theme_choice != st.session_state.theme_name:
-    st.session_state.theme_name = theme_choice
-inject_css()
-
-col1, col2 = st.sidebar.columns(2)
-with col1:
-    st.session_state.density = st.selectbox("Densidad", ["Compacto","Normal","Amplio"], index=["Compacto","Normal","Amplio"].index(st.session_state.density))
-with col2:
-    st.session_state.radius = st.selectbox("Esquinas", ["Small","Medium","Large"], index=["Small","Medium","Large"].index(st.session_state.radius))
-st.session_state.contrast = st.sidebar.slider("Profundidad", 0.00, 0.18, st.session_state.contrast, 0.01)
-inject_css()
-
-st.sidebar.markdown("---")
-st.sidebar.subheader("Ritmo (Parte 2)")
-st.session_state.anim_on = st.sidebar.toggle("Animar tipeo", value=st.session_state.anim_on)
-st.session_state.agent_typing_speed = st.sidebar.slider("Vel. agente", 0.005, 0.05, st.session_state.agent_typing_speed, 0.001)
-st.session_state.patient_thinking_delay = st.sidebar.slider("Pausa paciente", 0.2, 3.0, st.session_state.patient_thinking_delay, 0.05)
-st.session_state.patient_typing_speed = st.sidebar.slider("Vel. paciente", 0.005, 0.05, st.session_state.patient_typing_speed, 0.001)
-st.session_state.show_timestamps = st.sidebar.toggle("Hora en mensajes", value=st.session_state.show_timestamps)
-
-st.sidebar.markdown("---")
-st.sidebar.subheader("Notas")
-st.session_state.notes = st.sidebar.text_area("Rápidas", value=st.session_state.notes, height=100)
-st.sidebar.caption("Flujo: Selección → Introducción → (Entrevista en Parte 2)")
+PAGE_SIZE = {"pick": 6, "cond": 4}
+
+def _reset_page(kind: str):
+    st.session_state[f"{kind}_page"] = 1
+
+def select_grid(kind: str, catalog: Catalog, state_key: str, ident: Callable[[object], str],
+                card: Callable[[object, bool], None], heading: str, sub: str, picked: str,
+                ncols: int, placeholder: str):
+    # Una sola página del catálogo: el costo del rerun no depende de su tamaño.
+    # Búsqueda y paginación aparecen sólo si el catálogo no cabe en una página.
+    size = PAGE_SIZE[kind]
+    paged = len(catalog) > size
+    hits = catalog.search(st.session_state.get(f"{kind}_query", "")) if paged else range(len(catalog))
+    items, page, pages = catalog.page(hits, st.session_state.get(f"{kind}_page", 1) - 1, size)
+    if paged:
+        st.session_state[f"{kind}_page"] = page + 1
+        sub = f"{len(hits):,} resultados • página {page + 1} de {pages}"
+    html(WAVE, title_html(heading, sub))
+    if paged:
+        q_col, p_col = st.columns([3, 1], gap="large")
+        q_col.text_input("Buscar", key=f"{kind}_query", placeholder=placeholder, label_visibility="collapsed",
+                         on_change=_reset_page, args=(kind,))
+        p_col.number_input("Página", min_value=1, max_value=max(1, pages), step=1,
+                           key=f"{kind}_page", label_visibility="collapsed")
+    cols = st.columns(ncols, gap="large")
+    for i, x in enumerate(items):
+        with cols[i % ncols]:
+            is_sel = (st.session_state[state_key] == ident(x))
+            card(x, is_sel)
+            if st.button(picked if is_sel else "Elegir", key=f"{kind}_{ident(x)}", use_container_width=True):
+                st.session_state[state_key] = ident(x)
+                st.rerun()
 
-# Header
-topbar()
-stepper(st.session_state.step)
-st.markdown('<hr class="sep">', unsafe_allow_html=True)
-
-# STEP: SELECT
-if st.session_state.step == "select":
-    st.markdown('<div class="card">', unsafe_allow_html=True)
-    L, R = st.columns([1.3, 1.0], gap="large")
-    with L:
-        title("Preconsulta asistida", "Selecciona paciente y condición")
-        st.markdown(
-            "<div class='kit-chips'>"
-            "<span class='chip'>Diseño profesional</span>"
-            "<span class='chip'>Color moderado</span>"
-            "<span class='chip'>Adaptativo</span>"
-            "</div>", unsafe_allow_html=True
-        )
-        st.markdown("</div>", unsafe_allow_html=True)
-    with R:
-        st.markdown(
-            "<div class='card soft'>"
-            "<div class='small'>Personaliza el tema en la barra lateral. Esta vista evita huecos grandes y mantiene contraste legible.</div>"
-            "</div>", unsafe_allow_html=True
+# Sidebar (profesional y breve)
+with prof.span("sidebar"):
+    st.sidebar.subheader("Apariencia")
+    theme_choice = st.sidebar.selectbox("Tema", list(THEMES.keys()), index=list(THEMES.keys()).index(st.session_state.theme_name))
+    if theme_choice != st.session_state.theme_name:
+        st.session_state.theme_name = theme_choice
+
+    col1, col2 = st.sidebar.columns(2)
+    with col1:
+        st.session_state.density = st.selectbox("Densidad", ["Compacto","Normal","Amplio"], index=["Compacto","Normal","Amplio"].index(st.session_state.density))
+    with col2:
+        st.session_state.radius = st.selectbox("Esquinas", ["Small","Medium","Large"], index=["Small","Medium","Large"].index(st.session_state.radius))
+    st.session_state.contrast = st.sidebar.slider("Profundidad", 0.00, 0.18, st.session_state.contrast, 0.01)
+    inject_css()
+
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Ritmo (Parte 2)")
+    st.session_state.anim_on = st.sidebar.toggle("Animar tipeo", value=st.session_state.anim_on)
+    st.session_state.client_typing = st.sidebar.toggle("Animar en navegador", value=st.session_state.client_typing)
+    st.session_state.agent_typing_speed = st.sidebar.slider("Vel. agente", 0.005, 0.05, st.session_state.agent_typing_speed, 0.001)
+    st.session_state.patient_thinking_delay = st.sidebar.slider("Pausa paciente", 0.2, 3.0, st.session_state.patient_thinking_delay, 0.05)
+    st.session_state.patient_typing_speed = st.sidebar.slider("Vel. paciente", 0.005, 0.05, st.session_state.patient_typing_speed, 0.001)
+    st.session_state.show_timestamps = st.sidebar.toggle("Hora en mensajes", value=st.session_state.show_timestamps)
+    st.session_state.live_mode = st.sidebar.toggle("Respuestas libres", value=st.session_state.live_mode,
+                                                   help="El paciente escribe; los hechos se extraen por palabras clave")
+    with st.sidebar.expander("Perfilado"):
+        st.session_state.profile_on = st.toggle("Medir reruns", value=st.session_state.profile_on)
+        st.session_state.profile_sink = st.text_input(
+            "Exportar spans a", value=st.session_state.profile_sink,
+            placeholder="spans.jsonl o trace.json",
+            help=f"Anexa cada rerun en {SPANS_DIR}: .json en formato Chrome trace, .jsonl una línea por span.",
         )
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)
-
-    title("Paciente")
-    cols = st.columns(3, gap="large")
-    for i, p in enumerate(PACIENTES):
-        with cols[i % 3]:
-            is_sel = (st.session_state.sel_patient == p.pid)
-            patient_card(p, is_sel)
-            label = "Seleccionado" if is_sel else "Elegir"
-            if st.button(label, key=f"pick_{p.pid}", use_container_width=True):
-                st.session_state.sel_patient = p.pid
-                st.rerun()
+        if sink_error:
+            st.error(sink_error)
+        label, spans = prof.last()
+        if st.session_state.profile_on and spans:
+            rows = "".join(f"| `{name}` | {ms:.1f} |\n" for name, ms in breakdown(spans))
+            st.markdown(f"Último rerun: **{label}**\n\n| span | ms |\n|---|---:|\n{rows}")
+        elif st.session_state.profile_on:
+            st.caption("El desglose aparece desde el próximo rerun.")
+        if st.session_state.profile_on and event_log() is not None:
+            ev = event_log().stats()
+            st.caption(f"Eventos: {ev['written']:,} escritos • {ev['dropped']:,} descartados • "
+                       f"cola {ev['depth']}/{event_log().max_queue} (máx. {ev['max_depth']})")
+
+    with st.sidebar.expander("Buscar en entrevistas"):
+        query = st.text_input("Buscar", key="search_query", label_visibility="collapsed",
+                              placeholder='dextrometorfano, "aura visual", migr*')
+        if query.strip():
+            t0 = time.perf_counter()
+            if log_follower() is not None:
+                log_follower().poll()
+            hits = transcript_index().search(query, limit=SEARCH_LIMIT)
+            ms = (time.perf_counter() - t0) * 1000
+            more = "+" if len(hits) >= SEARCH_LIMIT else ""
+            by_interview: Dict[Tuple[str, str, str], List[Hit]] = {}
+            for h in hits:
+                by_interview.setdefault((h.session, h.pid, h.cid), []).append(h)
+            st.caption(f"{len(by_interview)}{more} entrevistas • {len(hits)}{more} coincidencias • {ms:.1f} ms")
+            rows = []
+            for (sid, pid, cid), found in list(reversed(by_interview.items()))[:SEARCH_SHOWN]:
+                who = CAT_PACIENTES.get(pid).nombre if pid in CAT_PACIENTES else (pid or "—")
+                cond = SCRIPTS[cid].condition.titulo if cid in SCRIPTS else cid
+                turns = ", ".join(str(i + 1) for i in sorted({h.idx for h in found}))
+                rows.append(f"- **{who}** · {cond} · `{sid}` · turnos {turns}")
+            if rows:
+                st.markdown("\n".join(rows))
+
+    st.sidebar.markdown("---")
+    st.sidebar.subheader("Notas")
+    st.session_state.notes = st.sidebar.text_area("Rápidas", value=st.session_state.notes, height=100)
+    st.sidebar.caption("Flujo: Selección → Introducción → (Entrevista en Parte 2)")
 
-    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)
-
-    title("Condición", "Elige la condición a evaluar")
-    cols2 = st.columns(2, gap="large")
-    for idx, c in enumerate(CONDICIONES):
-        with cols2[idx % 2]:
-            is_sel = (st.session_state.sel_condition == c.cid)
-            condition_card(c, is_sel)
-            label = "Seleccionada" if is_sel else "Elegir"
-            if st.button(label, key=f"cond_{c.cid}", use_container_width=True):
-                st.session_state.sel_condition = c.cid
+# Header
+with prof.span("header"):
+    html(header_html(st.session_state.step))
+
+# (las vistas "convo" y "analytics" se miden en la Parte 2)
+with prof.span(f"view:{st.session_state.step}") if st.session_state.step in ("select", "intro") else nullcontext():
+    # STEP: SELECT
+    if st.session_state.step == "select":
+        L, R = st.columns([1.3, 1.0], gap="large")
+        with L:
+            html(card_html(
+                title_html("Preconsulta asistida", "Selecciona paciente y condición")
+                + chips_html(["Diseño profesional", "Color moderado", "Adaptativo"])
+            ))
+        with R:
+            html(card_html(
+                "<div class='small'>Personaliza el tema en la barra lateral. Esta vista evita huecos grandes y mantiene contraste legible.</div>",
+                "card soft",
+            ))
+
+        select_grid("pick", CAT_PACIENTES, "sel_patient", lambda p: p.pid, patient_card,
+                    "Paciente", "", "Seleccionado", ncols=3, placeholder="Buscar por nombre, id o condición de base")
+        select_grid("cond", CAT_CONDICIONES, "sel_condition", lambda c: c.cid, condition_card,
+                    "Condición", "Elige la condición a evaluar", "Seleccionada", ncols=2, placeholder="Buscar condición")
+
+        html(WAVE)
+        CTA1, CTA2, CTA3 = st.columns([1.1, 1.1, 2.8], gap="large")
+        with CTA1:
+            can_go = st.session_state.sel_patient and st.session_state.sel_condition
+            if st.button("Continuar", disabled=not can_go, use_container_width=True):
+                st.session_state.step = "intro"; st.rerun()
+        with CTA2:
+            if st.button("Volver a inicio", use_container_width=True):
+                st.session_state.sel_patient = None
+                st.session_state.sel_condition = None
                 st.rerun()
-
-    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)
-    CTA1, CTA2, CTA3 = st.columns([1.1, 1.1, 2.8], gap="large")
-    with CTA1:
-        can_go = st.session_state.sel_patient and st.session_state.sel_condition
-        if st.button("Continuar", disabled=not can_go, use_container_width=True):
-            st.session_state.step = "intro"; st.rerun()
-    with CTA2:
-        if st.button("Volver a inicio", use_container_width=True):
-            st.session_state.sel_patient = None
-            st.session_state.sel_condition = None
-            st.rerun()
-    with CTA3:
-        if st.session_state.sel_patient and st.session_state.sel_condition:
-            p = next(x for x in PACIENTES if x.pid == st.session_state.sel_patient)
-            c = next(x for x in CONDICIONES if x.cid == st.session_state.sel_condition)
-            st.markdown(
-                f"<span class='badge'>Paciente: {p.nombre}</span> &nbsp; "
-                f"<span class='badge'>Condición: {c.titulo}</span>",
-                unsafe_allow_html=True,
+        with CTA3:
+            if st.session_state.sel_patient and st.session_state.sel_condition:
+                p = CAT_PACIENTES.get(st.session_state.sel_patient)
+                c = CAT_CONDICIONES.get(st.session_state.sel_condition)
+                st.markdown(
+                    f"<span class='badge'>Paciente: {p.nombre}</span> &nbsp; "
+                    f"<span class='badge'>Condición: {c.titulo}</span>",
+                    unsafe_allow_html=True,
+                )
+            else:
+                st.markdown("<span class='small'>Selecciona paciente y condición para continuar.</span>", unsafe_allow_html=True)
+
+    # STEP: INTRO
+    elif st.session_state.step == "intro":
+        p = CAT_PACIENTES.get(st.session_state.sel_patient)
+        c = CAT_CONDICIONES.get(st.session_state.sel_condition)
+
+        headL, headR = st.columns([1.25, 1.0], gap="large")
+        with headL:
+            html(
+                card_html(title_html("Agente de preconsulta", "Resumen previo para tu consulta")
+                          + chips_html(["Guía clínica", "EHR", "Hechos útiles"])),
+                info_block_html(
+                    "¿Cómo usarlo?",
+                    [
+                        "Confirma paciente y condición.",
+                        "En la Parte 2, la entrevista avanza con pausas naturales y tipeo por rol.",
+                        "El reporte se construye en paralelo (Motivo, HPI, antecedentes, medicaciones, hechos útiles).",
+                        "Al final verás faltantes sugeridos para cerrar calidad clínica.",
+                    ],
+                    chips=["Ritmo humano", "Exportación (Parte 2)", "Diseño profesional"],
+                    soft=True, ordered=True,
+                ),
             )
-        else:
-            st.markdown("<span class='small'>Selecciona paciente y condición para continuar.</span>", unsafe_allow_html=True)
 
-# STEP: INTRO
-elif st.session_state.step == "intro":
-    p = next(x for x in PACIENTES if x.pid == st.session_state.sel_patient)
-    c = next(x for x in CONDICIONES if x.cid == st.session_state.sel_condition)
+        with headR:
+            html(
+                card_html(
+                    title_html(f"Paciente: {p.nombre}", f"{p.edad} años • {p.sexo}")
+                    + "<div class='ph-img' style='margin-top:6px'>Imagen del paciente</div>"
+                    + "<div class='small' style='margin-top:8px'>Condición base: <b>"+p.condicion_base+"</b></div>"
+                ),
+                card_html(title_html("Condición a explorar", c.titulo) + f"<div class='small'>{c.descripcion}</div>"),
+            )
 
-    headL, headR = st.columns([1.25, 1.0], gap="large")
-    with headL:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        title("Agente de preconsulta", "Resumen previo para tu consulta")
-        st.markdown(
-            "<div class='kit-chips'>"
-            "<span class='chip'>Guía clínica</span>"
-            "<span class='chip'>EHR</span>"
-            "<span class='chip'>Hechos útiles</span>"
-            "</div>", unsafe_allow_html=True
-        )
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        info_block(
-            "¿Cómo usarlo?",
-            textwrap.dedent("""
-            1) Confirma paciente y condición.  
-            2) En la Parte 2, la entrevista avanza con pausas naturales y tipeo por rol.  
-            3) El reporte se construye en paralelo (Motivo, HPI, antecedentes, medicaciones, hechos útiles).  
-            4) Al final verás faltantes sugeridos para cerrar calidad clínica.
-            """),
-            chips=["Ritmo humano", "Exportación (Parte 2)", "Diseño profesional"],
-            soft=True,
+        ritmo = info_block_html(
+            "Ritmo humano activo",
+            [
+                f"Animación de tipeo: {'sí' if st.session_state.anim_on else 'no'}",
+                f"Velocidad (agente): {st.session_state.agent_typing_speed:.3f} s/char",
+                f"Pausa previa (paciente): {st.session_state.patient_thinking_delay:.2f} s",
+                f"Velocidad (paciente): {st.session_state.patient_typing_speed:.3f} s/char",
+                f"Timestamps: {'sí' if st.session_state.show_timestamps else 'no'}",
+            ],
+            chips=["Natural", "Controlado"],
         )
-
-    with headR:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        title(f"Paciente: {p.nombre}", f"{p.edad} años • {p.sexo}")
-        st.markdown("<div class='ph-img' style='margin-top:6px'>Imagen del paciente</div>", unsafe_allow_html=True)
-        st.markdown("<div class='small' style='margin-top:8px'>Condición base: <b>"+p.condicion_base+"</b></div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        title("Condición a explorar", c.titulo)
-        st.markdown(f"<div class='small'>{c.descripcion}</div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)
-
-    st.markdown('<div class="grid">', unsafe_allow_html=True)
-    st.markdown('<div class="col-8">', unsafe_allow_html=True)
-    info_block(
-        "Ritmo humano activo",
-        textwrap.dedent(f"""
-        - Animación de tipeo: {"sí" if st.session_state.anim_on else "no"}  
-        - Velocidad (agente): {st.session_state.agent_typing_speed:.3f} s/char  
-        - Pausa previa (paciente): {st.session_state.patient_thinking_delay:.2f} s  
-        - Velocidad (paciente): {st.session_state.patient_typing_speed:.3f} s/char  
-        - Timestamps: {"sí" if st.session_state.show_timestamps else "no"}
-        """),
-        chips=["Natural", "Controlado"],
-        soft=False,
-    )
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    st.markdown('<div class="col-4">', unsafe_allow_html=True)
-    info_block(
-        "Tema visual",
-        textwrap.dedent(f"""
-        - Tema: {st.session_state.theme_name}  
-        - Densidad: {st.session_state.density}  
-        - Esquinas: {st.session_state.radius}  
-        - Profundidad: {st.session_state.contrast:.2f}
-        """),
-        chips=["Color moderado", "Legible"],
-        soft=False,
-    )
-    st.markdown('</div>', unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
-
-    st.markdown('<div class="wave"></div>', unsafe_allow_html=True)
-
-    B1, B2, B3 = st.columns([1.1, 1.1, 2.8], gap="large")
-    with B1:
-        if st.button("◀ Regresar", use_container_width=True):
-            st.session_state.step = "select"; st.rerun()
-    with B2:
-        if st.session_state.convo_enabled:
-            if st.button("Iniciar entrevista", use_container_width=True):
-                st.session_state.step = "convo"
-                st.session_state.chat_idx = -1
-                st.session_state.pause = False
-                st.rerun()
-        else:
-            st.button("Iniciar entrevista", key="start_disabled", use_container_width=True, disabled=True)
-            st.caption("Pega la PARTE 2 para habilitar la entrevista.")
-    with B3:
-        st.markdown(
-            f"<div class='kpis'>"
-            f"<span class='badge'>Paciente: {p.nombre}</span>"
-            f"<span class='badge'>Condición: {c.titulo}</span>"
-            f"<span class='badge'>Conversación guiada</span>"
-            f"</div>",
-            unsafe_allow_html=True,
+        tema = info_block_html(
+            "Tema visual",
+            [
+                f"Tema: {st.session_state.theme_name}",
+                f"Densidad: {st.session_state.density}",
+                f"Esquinas: {st.session_state.radius}",
+                f"Profundidad: {st.session_state.contrast:.2f}",
+            ],
+            chips=["Color moderado", "Legible"],
         )
+        html(WAVE, f"<div class='grid'><div class='col-8'>{ritmo}</div><div class='col-4'>{tema}</div></div>", WAVE)
+
+        B1, B2, B3 = st.columns([1.1, 1.1, 2.8], gap="large")
+        with B1:
+            if st.button("◀ Regresar", use_container_width=True):
+                st.session_state.step = "select"; st.rerun()
+        with B2:
+            if st.session_state.convo_enabled:
+                if st.button("Iniciar entrevista", use_container_width=True):
+                    st.session_state.step = "convo"
+                    st.session_state.chat_idx = -1
+                    st.session_state.transcript_html = ""
+                    st.session_state.transcript_turns = 0
+                    st.session_state["_agent_texts"] = {}
+                    st.session_state.live_answers = []       # respuestas libres de la entrevista anterior
+                    st.session_state.pop("_live", None)
+                    st.session_state.pause = False
+                    log_event("start", pid=p.pid, cid=c.cid)
+                    st.rerun()
+            else:
+                st.button("Iniciar entrevista", key="start_disabled", use_container_width=True, disabled=True)
+                st.caption("Pega la PARTE 2 para habilitar la entrevista.")
+        with B3:
+            st.markdown(
+                f"<div class='kpis'>"
+                f"<span class='badge'>Paciente: {p.nombre}</span>"
+                f"<span class='badge'>Condición: {c.titulo}</span>"
+                f"<span class='badge'>Conversación guiada</span>"
+                f"</div>",
+                unsafe_allow_html=True,
+            )
 
 st.markdown("<div class='footer-note'>Interfaz profesional y moderna — color equilibrado y rendimiento fluido.</div>", unsafe_allow_html=True)
 # ─────────────────────────────────────────────────────────────────────────────
@@ -521,309 +619,476 @@ st.markdown("<div class='footer-note'>Interfaz profesional y moderna — color e
 # Estética profesional, rendimiento fluido, sin filtros.
 # ─────────────────────────────────────────────────────────────────────────────
 
-import time
-from typing import List, Tuple, Dict
+from html import escape as escape_html
+import tempfile
+from typing import Iterator, Sequence, Tuple
+import pandas as pd
+import streamlit.components.v1 as components
+
+from preconsulta import (
+    Rule, Turn, TYPING_FPS, TurnScheduler, compose_json, compose_markdown, with_ehr, write_zip,
+)
+from preconsulta.analytics import Analytics
+from preconsulta.backend import StreamHandle, StreamRunner, TurnRequest, open_agent_backend
+from preconsulta.matcher import LiveFacts
 
 # Habilita el botón "Iniciar entrevista" definido en la PARTE 1
 st.session_state.convo_enabled = True
 
-# ----------------------------------------------------------------------------- 
-# Guiones de entrevista (una lista de turnos) y reglas para componer el reporte
-# -----------------------------------------------------------------------------
-Turn = Tuple[str, str]         # ("agent"|"patient", "texto")
-Rule = Tuple[int, str, str]    # (idx_turno_alcanzado, "Sección", "Hecho")
-
-def script_serotonin() -> Tuple[List[Turn], List[Rule], List[str]]:
-    chat: List[Turn] = [
-        ("agent","Gracias por tu tiempo. Para anticipar la consulta, te haré preguntas breves. ¿Cuál es tu principal molestia hoy?"),
-        ("patient","Me siento muy inquieto, sudo mucho y noto mis pupilas grandes."),
-        ("agent","¿Desde cuándo empezó y cómo fue el inicio?"),
-        ("patient","Comenzó hace dos días de manera súbita."),
-        ("agent","¿Has tenido fiebre, escalofríos, rigidez o temblores?"),
-        ("patient","Fiebre no estoy seguro, pero sí escalofríos y rigidez."),
-        ("agent","¿Notas movimientos oculares extraños o visión borrosa?"),
-        ("patient","A veces siento los ojos como temblorosos y la luz me molesta."),
-        ("agent","¿Tomaste o ajustaste medicamentos recientemente, incluyendo jarabes para la tos o suplementos?"),
-        ("patient","Uso fluoxetina diario y ayer tomé un antitusivo con dextrometorfano."),
-        ("agent","¿Has consumido alcohol, estimulantes o drogas recreativas en los últimos días?"),
-        ("patient","No, no he consumido nada de eso."),
-        ("agent","¿Tienes náusea, diarrea o vómito?"),
-        ("patient","Náusea leve. Ni diarrea ni vómito."),
-        ("agent","¿Cómo dormiste estas noches?"),
-        ("patient","Dormí poco y me noté inquieto."),
-        ("agent","¿Has tenido dolores de cabeza, rigidez marcada o espasmos musculares?"),
-        ("patient","Sí, sobre todo rigidez en piernas."),
-        ("agent","¿Cambiaste dosis de la fluoxetina o agregaste otro medicamento recetado?"),
-        ("patient","No cambié dosis. Solo el jarabe."),
-        ("agent","Voy a compilar un resumen para tu médico. Si algo es inexacto, avísame."),
-    ]
-    rules: List[Rule] = [
-        (1, "Motivo principal", "Inquietud, diaforesis y midriasis."),
-        (3, "HPI", "Inicio súbito hace ~2 días."),
-        (5, "Signos autonómicos", "Escalofríos y rigidez."),
-        (7, "Signos oculares", "Molestia a la luz; sensación de movimientos oculares."),
-        (9, "Medicaciones (EHR)", "Fluoxetina (ISRS) — uso crónico."),
-        (9, "Medicaciones (entrevista)", "Dextrometorfano — uso reciente."),
-        (11, "Historia dirigida", "Niega alcohol y estimulantes recientes."),
-        (13, "HPI", "Náusea leve, sin diarrea ni vómito."),
-        (15, "HPI", "Insomnio e inquietud."),
-        (17, "Historia dirigida", "Rigidez en piernas."),
-        (19, "Historia dirigida", "Sin cambio de dosis del ISRS."),
-    ]
-    faltantes: List[str] = [
-        "Signos vitales objetivos: temperatura, FC, TA y SatO₂.",
-        "Exploración neuromuscular dirigida: hiperreflexia, clonus, tono.",
-        "Cronología/dosis exacta de cada fármaco (ISRS/OTC) y tiempos.",
-        "Descartar otras causas de agitación (intoxicación, abstinencia).",
-    ]
-    return chat, rules, faltantes
-
-def script_migraine() -> Tuple[List[Turn], List[Rule], List[str]]:
-    chat: List[Turn] = [
-        ("agent","Vamos a caracterizar tu dolor de cabeza para orientar el manejo. ¿Cómo describirías el dolor y dónde se localiza?"),
-        ("patient","Es pulsátil y se concentra del lado derecho."),
-        ("agent","¿Empezó cuándo y cuánto dura cada episodio?"),
-        ("patient","Ayer por la tarde y dura varias horas."),
-        ("agent","¿La luz o el sonido empeoran? ¿Náusea o vómito?"),
-        ("patient","La luz y el ruido empeoran. Náusea leve, sin vómito."),
-        ("agent","¿Antes de que empiece notas aura visual u hormigueo?"),
-        ("patient","A veces veo destellos antes del dolor."),
-        ("agent","¿Dormiste menos, ayunaste o consumiste cafeína tarde?"),
-        ("patient","Dormí poco y tomé café por la noche."),
-        ("agent","¿Qué analgésicos has usado y qué tanto ayudan?"),
-        ("patient","Ibuprofeno; alivia parcialmente."),
-        ("agent","¿Hay antecedentes familiares de migraña?"),
-        ("patient","Sí, mi madre."),
-        ("agent","¿El dolor te limita actividades o trabajo?"),
-        ("patient","Sí, me cuesta concentrarme."),
-        ("agent","Con esto armaré un resumen para tu médico."),
-    ]
-    rules: List[Rule] = [
-        (1, "Motivo principal", "Cefalea pulsátil lateralizada."),
-        (3, "HPI", "Inicio ayer; crisis por horas."),
-        (5, "HPI", "Fotofobia y fonofobia; náusea leve."),
-        (7, "Historia dirigida", "Aura visual ocasional."),
-        (9, "Historia dirigida", "Privación de sueño y cafeína tardía."),
-        (11, "Medicaciones (entrevista)", "Ibuprofeno PRN con respuesta parcial."),
-        (13, "Antecedentes familiares", "Madre con migraña."),
-        (15, "Limitación funcional", "Impacto en concentración y actividades."),
-    ]
-    faltantes: List[str] = [
-        "Frecuencia mensual de los episodios y escala de dolor.",
-        "Pruebas de ‘red flags’: inicio en trueno, fiebre, déficit neurológico.",
-        "Uso previo de triptanos y eficacia.",
-        "Desencadenantes personales (estrés, ciclo, ayuno, olores).",
-    ]
-    return chat, rules, faltantes
-
-def script_flu() -> Tuple[List[Turn], List[Rule], List[str]]:
-    chat: List[Turn] = [
-        ("agent","Voy a registrar síntomas respiratorios para orientar la visita. ¿Has tenido fiebre y dolor corporal?"),
-        ("patient","Sí, fiebre y el cuerpo cortado."),
-        ("agent","¿Tos o congestión? ¿Desde cuándo?"),
-        ("patient","Tos seca hace tres días y nariz tapada."),
-        ("agent","¿Dificultad para respirar o dolor en el pecho?"),
-        ("patient","No, solo cansancio."),
-        ("agent","¿Tomaste algún medicamento?"),
-        ("patient","Paracetamol y un antigripal."),
-        ("agent","¿Contacto con personas enfermas o vacunación reciente?"),
-        ("patient","Mi pareja tuvo gripe; me vacuné hace 8 meses."),
-        ("agent","¿Antecedentes o factores de riesgo (asma, embarazo, inmunosupresión)?"),
-        ("patient","No."),
-        ("agent","Gracias, prepararé un resumen."),
-    ]
-    rules: List[Rule] = [
-        (1, "Motivo principal", "Fiebre, mialgia y malestar."),
-        (3, "HPI", "Tos seca y congestión de 3 días."),
-        (5, "HPI", "Sin disnea ni dolor torácico."),
-        (7, "Medicaciones (entrevista)", "Paracetamol + antigripal."),
-        (9, "Historia dirigida", "Contacto positivo; vacunación hace 8 meses."),
-        (11, "Factores de riesgo", "Niega comorbilidades relevantes."),
-    ]
-    faltantes: List[str] = [
-        "Temperatura y saturación de O₂.",
-        "Criterios de prueba diagnóstica según guía local.",
-        "Indicaciones de alarma y aislamiento domiciliario.",
-    ]
-    return chat, rules, faltantes
-
-def script_malaria() -> Tuple[List[Turn], List[Rule], List[str]]:
-    chat: List[Turn] = [
-        ("agent","Quiero documentar el patrón febril para orientar estudios. ¿La fiebre es intermitente con escalofríos?"),
-        ("patient","Sí, sube y baja con sudoración."),
-        ("agent","¿Has viajado a zona endémica recientemente?"),
-        ("patient","Sí, estuve en selva hace dos semanas."),
-        ("agent","¿Tienes cefalea, náusea o dolor muscular?"),
-        ("patient","Cefalea y cuerpo cortado."),
-        ("agent","¿Tomaste profilaxis antipalúdica?"),
-        ("patient","No."),
-        ("agent","¿Notas coloración amarillenta en piel u ojos, orina oscura o dolor en costado?"),
-        ("patient","No lo he notado."),
-        ("agent","Perfecto, armaré un resumen para tu médico."),
-    ]
-    rules: List[Rule] = [
-        (1, "Motivo principal", "Fiebre intermitente con escalofríos y sudoración."),
-        (3, "HPI", "Viaje a zona endémica hace 2 semanas."),
-        (5, "HPI", "Cefalea y mialgias."),
-        (7, "Historia dirigida", "Sin profilaxis."),
-        (9, "Historia dirigida", "Niega ictericia u orina oscura."),
-    ]
-    faltantes: List[str] = [
-        "Prueba rápida/frotis y gota gruesa para confirmar.",
-        "Patrón horario de la fiebre y respuesta a antipiréticos.",
-        "Exploración de anemia y esplenomegalia.",
-    ]
-    return chat, rules, faltantes
-
-SCRIPTS: Dict[str, callable] = {
-    "ss": script_serotonin,
-    "mig": script_migraine,
-    "flu": script_flu,
-    "mal": script_malaria,
-}
-
-# ----------------------------------------------------------------------------- 
-# Construcción del reporte a partir de reglas
-# -----------------------------------------------------------------------------
-EHR_SEED = {
-    "Antecedentes (EHR)": ["Antecedente crónico declarado en ficha del paciente"],
-    "Medicaciones (EHR)": ["Medicación habitual según expediente (si aplica)"],
-}
-
-SECTION_ORDER = [
-    "Motivo principal",
-    "HPI",
-    "Antecedentes (EHR)",
-    "Medicaciones (EHR)",
-    "Medicaciones (entrevista)",
-    "Signos autonómicos",
-    "Signos oculares",
-    "Historia dirigida",
-    "Antecedentes familiares",
-    "Factores de riesgo",
-    "Limitación funcional",
-    "Hechos útiles",
-]
-
-def seed_facts() -> Dict[str, List[str]]:
-    facts: Dict[str, List[str]] = {k: [] for k in SECTION_ORDER}
-    for k, arr in EHR_SEED.items():
-        if k in facts:
-            facts[k] = arr.copy()
-    return facts
-
-def facts_up_to(idx_limit: int, rules: List[Rule]) -> Dict[str, List[str]]:
-    facts = seed_facts()
-    for i_lim, section, text in rules:
-        if idx_limit >= i_lim:
-            facts.setdefault(section, []).append(text)
-    # Consolidar "Hechos útiles" desde secciones orientadas a datos puntuales
-    utiles = []
-    for sec in ("Signos autonómicos","Signos oculares","Historia dirigida","Factores de riesgo","Limitación funcional"):
-        utiles += facts.get(sec, [])
-    if utiles:
-        facts["Hechos útiles"] = utiles
-    return facts
-
-def render_box(title_txt: str, items: List[str] | str):
-    st.markdown('<div class="card" style="margin-bottom:10px">', unsafe_allow_html=True)
-    st.markdown(f"**{title_txt}:**", unsafe_allow_html=True)
+def box_html(title_txt: str, items: List[str] | str) -> str:
     if isinstance(items, list):
-        if items:
-            st.markdown("<ul>" + "".join([f"<li>{st.session_state.get('•','•')} {x}</li>" for x in items]) + "</ul>", unsafe_allow_html=True)
-        else:
-            st.markdown("—", unsafe_allow_html=True)
+        body = ("<ul>" + "".join(f"<li>• {x}</li>" for x in items) + "</ul>") if items else "<p>—</p>"
     else:
-        st.markdown(items or "—", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
-
-def compose_markdown(idx_limit: int, rules: List[Rule], p_name: str, c_title: str) -> str:
-    facts = facts_up_to(idx_limit, rules)
-    out: List[str] = []
-    out.append("# Reporte de Preconsulta\n")
-    out.append(f"**Paciente:** {p_name}  \n**Condición:** {c_title}\n")
-    motivo = facts["Motivo principal"][0] if facts["Motivo principal"] else "—"
-    out.append(f"**Motivo principal:** {motivo}\n")
-    def section_md(name: str):
-        arr = facts.get(name, [])
-        if not arr: return [f"- —"]
-        return [f"- {x}" for x in arr]
-    out.append("## Historia de la enfermedad actual (HPI)")
-    out += section_md("HPI")
-    out.append("\n## Antecedentes (EHR)")
-    out += section_md("Antecedentes (EHR)")
-    out.append("\n## Medicaciones")
-    meds = []
-    for m in facts.get("Medicaciones (EHR)", []): meds.append(f"- {m}")
-    for m in facts.get("Medicaciones (entrevista)", []): meds.append(f"- **{m}**")
-    out += meds if meds else ["- —"]
-    utiles = facts.get("Hechos útiles", [])
-    if utiles:
-        out.append("\n## Hechos útiles")
-        out += [f"- {x}" for x in utiles]
-    return "\n".join(out)
-
-def render_report(idx_limit: int, rules: List[Rule], faltantes: List[str]):
-    fx = facts_up_to(idx_limit, rules)
-    render_box("Motivo principal", (fx["Motivo principal"][0] if fx["Motivo principal"] else "—"))
-    render_box("Historia de la enfermedad actual (HPI)", fx["HPI"])
-    render_box("Antecedentes (EHR)", fx["Antecedentes (EHR)"])
-    st.markdown('<div class="card" style="margin-bottom:10px">', unsafe_allow_html=True)
-    st.markdown("**Medicaciones (EHR y entrevista):**", unsafe_allow_html=True)
+        body = f"<p>{items or '—'}</p>"
+    return card_html(f"<b>{title_txt}:</b>{body}", style="margin-bottom:10px")
+
+def report_html(fx: Dict[str, List[str]], faltantes: Sequence[str], show_checklist: bool) -> str:
+    parts = [
+        box_html("Motivo principal", (fx["Motivo principal"][0] if fx["Motivo principal"] else "—")),
+        box_html("Historia de la enfermedad actual (HPI)", fx["HPI"]),
+        box_html("Antecedentes (EHR)", fx["Antecedentes (EHR)"]),
+    ]
     meds = [f"<li>{m}</li>" for m in fx["Medicaciones (EHR)"]]
     meds += [f"<li><span class='badge'>{m}</span></li>" for m in fx["Medicaciones (entrevista)"]]
-    st.markdown("<ul>"+ "".join(meds) +"</ul>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+    parts.append(card_html("<b>Medicaciones (EHR y entrevista):</b><ul>" + "".join(meds) + "</ul>", style="margin-bottom:10px"))
     utiles = fx.get("Hechos útiles", [])
     if utiles:
-        render_box("Hechos útiles", utiles)
-    if idx_limit >= len(rules):
-        st.markdown('<div class="card" style="border:1px solid rgba(245, 158, 11, .35); background: color-mix(in oklab, var(--bg-card) 90%, #F59E0B 10%);">', unsafe_allow_html=True)
-        st.markdown("**Checklist sugerida para completar en la consulta:**", unsafe_allow_html=True)
-        for x in faltantes:
-            st.markdown(f"- {x}", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
+        parts.append(box_html("Hechos útiles", utiles))
+    if show_checklist:
+        parts.append(card_html(
+            "<b>Checklist sugerida para completar en la consulta:</b>" + list_html(list(faltantes)),
+            style="border:1px solid rgba(245, 158, 11, .35); background: color-mix(in oklab, var(--bg-card) 90%, #F59E0B 10%);",
+        ))
+    return "".join(parts)
 
 # ----------------------------------------------------------------------------- 
 # Animación de tipeo y utilidades de ritmo
 # -----------------------------------------------------------------------------
-def typewriter(ph, text: str, speed: float):
-    if not st.session_state.anim_on:
-        ph.markdown(text, unsafe_allow_html=True)
-        return
-    buf = ""
-    for ch in text:
-        buf += ch
-        ph.markdown(buf, unsafe_allow_html=True)
-        time.sleep(max(0.001, speed))
+SCHED_TICK = 1.0 / TYPING_FPS   # cadencia del fragmento de entrevista
+
+def scheduler() -> TurnScheduler:
+    if "_scheduler" not in st.session_state:
+        st.session_state["_scheduler"] = TurnScheduler(clock())
+    return st.session_state["_scheduler"]
+
+# Componente de tipeo en el navegador: recibe el turno completo una sola vez,
+# lo anima del lado del cliente y devuelve el índice del turno al terminar.
+_typing_component = components.declare_component(
+    "typing_bubble",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "typing"),
+)
 
-def timestamp() -> str:
-    return datetime.now().strftime('%H:%M') if st.session_state.show_timestamps else ""
+def _advance_turn(key: str, idx: int):
+    if st.session_state.get(key) == idx and st.session_state.chat_idx == idx - 1:
+        st.session_state.chat_idx = idx
+
+def typing_bubble(role: str, text: str, idx: int, speed: float, delay: float):
+    key = f"typing_{st.session_state.sel_condition}_{idx}"
+    _typing_component(
+        role=role, text=text, turn=idx, speed=speed, delay=delay,
+        animate=st.session_state.anim_on, timestamp=timestamp(),
+        theme=THEMES[st.session_state.theme_name],
+        # Los componentes llaman on_change() sin argumentos: se atan aquí
+        key=key, default=None, on_change=partial(_advance_turn, key, idx),
+    )
 
-def render_message(role: str, text: str):
-    who = "Asistente" if role == "agent" else "Paciente"
-    klass = "agent" if role == "agent" else "patient"
-    st.markdown(f"<div class='msg {klass}'><b>{who}:</b> {text}" + (f"<br><small>{timestamp()}</small>" if timestamp() else "") + "</div>", unsafe_allow_html=True)
+def timestamp() -> str:
+    return clock().now().strftime('%H:%M') if st.session_state.show_timestamps else ""
 
-def render_typing(role: str) -> st.delta_generator.DeltaGenerator:
+def message_html(role: str, text: str, ts: str = "") -> str:
     who = "Asistente" if role == "agent" else "Paciente"
     klass = "agent" if role == "agent" else "patient"
-    st.markdown(f"<div class='msg {klass}'><b>{who}:</b> ", unsafe_allow_html=True)
-    ph = st.empty()
-    if timestamp():
-        st.markdown(f"<br><small>{timestamp()}</small></div>", unsafe_allow_html=True)
+    return f"<div class='msg {klass}'><b>{who}:</b> {text}" + (f"<br><small class='ts'>{ts}</small>" if ts else "") + "</div>"
+
+def reset_transcript():
+    st.session_state.transcript_html = ""
+    st.session_state.transcript_turns = 0
+
+# Backend de modelo opcional (PRECONSULTA_AGENT_URL=http://host:puerto): los
+# turnos del agente se transmiten token a token desde un event loop de fondo;
+# sin él, el texto del guion con la animación de siempre.
+@st.cache_resource
+def agent_backend(url: str) -> Optional[StreamRunner]:
+    if not url:
+        return None
+    runner = open_agent_backend(url)
+    atexit.register(runner.close)
+    return runner
+
+AGENT = agent_backend(os.environ.get("PRECONSULTA_AGENT_URL", ""))
+
+def agent_texts() -> Dict[Tuple[str, int], str]:
+    # Texto generado por (cid, turno); reemplaza al del guion en la transcripción
+    return st.session_state.setdefault("_agent_texts", {})
+
+def agent_streams() -> Dict[Tuple[str, int], StreamHandle]:
+    return st.session_state.setdefault("_streams", {})
+
+def cancel_streams():
+    # Pausa, salida, reinicio o salto: se corta la generación en curso
+    for handle in agent_streams().values():
+        handle.cancel()
+    st.session_state["_streams"] = {}
+    st.session_state["_agent_asked"] = {}
+
+def turn_text(cid: str, chat: Sequence[Turn], i: int) -> str:
+    generated = agent_texts().get((cid, i))
+    return chat[i][1] if generated is None else escape_html(generated)
+
+def agent_stream(cid: str, chat: Sequence[Turn], i: int) -> StreamHandle:
+    # Un stream adelantado sólo sirve si se pidió con la misma historia
+    streams = agent_streams()
+    texts = agent_texts()
+    history = tuple((role, texts.get((cid, j), txt)) for j, (role, txt) in enumerate(chat[:i]))
+    handle = streams.get((cid, i))
+    if handle is not None and handle.request.history != history:
+        handle.cancel()
+        handle = None
+    if handle is None:
+        handle = streams[(cid, i)] = AGENT.start(TurnRequest(cid, i, history, chat[i][1]), clock())
+    return handle
+
+def prefetch_agent(cid: str, chat: Sequence[Turn], i: int):
+    # Mientras se anima el turno i del paciente (o corre su demora de
+    # "pensar"), el siguiente turno del agente ya se genera en el fondo.
+    if (AGENT is not None and not st.session_state.pause and i + 1 < len(chat)
+            and chat[i][0] == "patient" and chat[i + 1][0] == "agent"):
+        agent_stream(cid, chat, i + 1)
+
+def append_turns(chat: Sequence[Turn], cid: str = ""):
+    # Cada turno emitido se renderiza una sola vez, con la hora real de emisión;
+    # la casilla "Hora en mensajes" sólo lo oculta vía CSS (.no-ts).
+    if st.session_state.transcript_turns > st.session_state.chat_idx + 1:
+        reset_transcript()
+    while st.session_state.transcript_turns <= st.session_state.chat_idx:
+        i = st.session_state.transcript_turns
+        st.session_state.transcript_html += message_html(chat[i][0], turn_text(cid, chat, i), clock().now().strftime('%H:%M'))
+        st.session_state.transcript_turns += 1
+        log_turn(cid, i, chat[i][0])
+
+def log_turn(cid: str, i: int, role: str):
+    log_turns(cid, range(i, i + 1))
+
+def log_turns(cid: str, turns: range, **extra: object):
+    # Turnos emitidos (o saltados con un seek) y los hechos que sus reglas
+    # suman al reporte: a la bitácora, en un solo envío, y al índice de búsqueda
+    if cid not in SCRIPTS or not turns:
+        return
+    sc = SCRIPTS[cid]
+    index, sid, pid = transcript_index(), session_id(), st.session_state.sel_patient
+    events: List[Tuple[str, Dict[str, object]]] = []
+    for i in turns:
+        text = agent_texts().get((cid, i), sc.chat[i][1])
+        events.append(("turn", dict(pid=pid, cid=cid, idx=i, role=sc.chat[i][0], text=text, **extra)))
+        index.add(sid, pid, cid, i, "turn", text)
+    for i_lim, section, fact in sc.rules:
+        if i_lim in turns:
+            events.append(("fact", dict(pid=pid, cid=cid, idx=i_lim, section=section, text=fact, **extra)))
+            index.add(sid, pid, cid, i_lim, "fact", fact)
+    log_events(events)
+
+@st.cache_resource
+def transcript_prefixes(cid: str) -> Tuple[str, Tuple[int, ...]]:
+    # Transcripción completa del guion (sin hora) y el corte tras cada turno
+    parts = [message_html(role, txt) for role, txt in SCRIPTS[cid].chat]
+    offsets = [0]
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+    return "".join(parts), tuple(offsets)
+
+def seek_to(cid: str, target: int, reason: str = "seek"):
+    # Salto instantáneo a un turno: transcripción y reporte salen de lo
+    # precalculado; los turnos saltados quedan sin hora de emisión. Un salto
+    # hacia adelante registra los turnos saltados (skipped) para que la
+    # bitácora y la búsqueda tengan la entrevista completa; una reanudación
+    # no, porque ya los registró el proceso anterior.
+    full, offsets = transcript_prefixes(cid)
+    target = max(-1, min(target, len(offsets) - 2))
+    if reason == "seek":
+        log_turns(cid, range(st.session_state.transcript_turns, target + 1), skipped=True)
+    scheduler().reset()
+    cancel_streams()
+    texts = {k: v for k, v in agent_texts().items() if k[0] != cid or k[1] <= target}
+    st.session_state["_agent_texts"] = texts
+    st.session_state.chat_idx = target
+    if any(k[0] == cid for k in texts):
+        chat = SCRIPTS[cid].chat
+        st.session_state.transcript_html = "".join(
+            message_html(chat[i][0], turn_text(cid, chat, i)) for i in range(target + 1))
     else:
-        st.markdown(f"</div>", unsafe_allow_html=True)
-    return ph
+        st.session_state.transcript_html = full[:offsets[target + 1]]
+    st.session_state.transcript_turns = target + 1
+    log_event(reason, cid=cid, idx=target)
+
+def _on_seek(cid: str):
+    seek_to(cid, st.session_state.seek_turns - 1)
+
+REPLAY_SPEEDS = [1, 2, 4, 8, 16]
+
+def chatwrap_html(body: str, extra: str = "") -> str:
+    klass = "chatwrap" if st.session_state.show_timestamps else "chatwrap no-ts"
+    return f"<div class='{klass}{extra}'>{body}</div>"
 
 # ----------------------------------------------------------------------------- 
 # Vista de conversación
 # -----------------------------------------------------------------------------
+def report_column(facts: Dict[str, List[str]], faltantes: Sequence[str], show_checklist: bool, p: Patient, c: Condition):
+    with prof.span("render_report"):
+        html(card_html(
+            title_html("Reporte generado", f"Paciente: {p.nombre} • Condición: {c.titulo}")
+            + report_html(facts, faltantes, show_checklist=show_checklist)
+        ))
+    # Los callables corren sólo al hacer clic, en otro hilo: nada se compone en el rerun
+    name = f"reporte_{p.pid}_{c.cid}"
+    st.download_button("⬇️ Exportar (.md)", data=logged_export(lambda: compose_markdown(facts, p.nombre, c.titulo),
+                                                               format="md", pid=p.pid, cid=c.cid),
+                       file_name=f"{name}.md", mime="text/markdown", use_container_width=True)
+    st.download_button("⬇️ Exportar (.json)", data=logged_export(lambda: compose_json(facts, p.nombre, c.titulo, p.pid, c.cid),
+                                                                 format="json", pid=p.pid, cid=c.cid),
+                       file_name=f"{name}.json", mime="application/json", use_container_width=True)
+
+def logged_export(render: Callable[[], str | bytes], **data: object) -> Callable[[], str | bytes]:
+    # Corre fuera del rerun (sin session_state): la sesión se captura ahora
+    log, sid = event_log(), session_id()
+    def run():
+        out = render()
+        if log is not None:
+            log.emit(sid, "export", data)
+        return out
+    return run
+
+def mark_completed(p: Patient, c: Condition, answers: Optional[List[str]] = None) -> bool:
+    # Registro para "Exportar completadas"; el dict se reemplaza, nunca se muta
+    key, value = f"{p.pid}:{c.cid}", None if answers is None else list(answers)
+    completed = st.session_state.completed
+    if key in completed and completed[key] == value:
+        return False
+    st.session_state.completed = {**completed, key: value}
+    log_event("complete", pid=p.pid, cid=c.cid, free_text=answers is not None)
+    return True
+
+def interview_facts(sc: Script, pid: str, answers: Optional[Sequence[str]]) -> Dict[str, List[str]]:
+    # Reporte final de una entrevista terminada, guiada o con respuestas libres
+    if answers is None:
+        facts = sc.facts_at(len(sc.chat) - 1)
+    else:
+        lf = LiveFacts(sc.matcher)
+        lf.feed_all(answers)
+        facts = lf.facts()
+    return with_ehr(facts, pid, RECORDS)
+
+def completed_entries(completed: Dict[str, Optional[List[str]]]) -> Iterator[Tuple[str, str]]:
+    # Perezoso: el zip pide un reporte a la vez. Un checkpoint puede nombrar
+    # pacientes o guiones que ya no están en el roster: se omiten.
+    for key, answers in sorted(completed.items()):
+        pid, _, cid = key.rpartition(":")
+        if pid not in CAT_PACIENTES or cid not in SCRIPTS:
+            continue
+        sc, p = SCRIPTS[cid], CAT_PACIENTES.get(pid)
+        facts = interview_facts(sc, pid, answers)
+        yield f"reporte_{pid}_{cid}.md", compose_markdown(facts, p.nombre, sc.condition.titulo)
+        yield f"reporte_{pid}_{cid}.json", compose_json(facts, p.nombre, sc.condition.titulo, pid, cid)
+
+def completed_zip(completed: Dict[str, Optional[List[str]]]) -> bytes:
+    # El zip se arma en un temporal en disco, un reporte a la vez; st.download_button
+    # necesita los bytes finales de todos modos, así que se leen una sola vez
+    # y el temporal se cierra (y se borra) al salir del with
+    with tempfile.TemporaryFile() as tmp:
+        write_zip(tmp, completed_entries(completed))
+        tmp.seek(0)
+        return tmp.read()
+
+def convo_panel(chat: Sequence[Turn], rules: Sequence[Rule], faltantes: Sequence[str], p: Patient, c: Condition):
+    # Fragmento: sólo el chat y el reporte se re-ejecutan en cada tick.
+    with prof.run("fragment"), prof.span("convo_panel"):
+        _convo_panel(chat, rules, faltantes, p, c)
+
+def _convo_panel(chat: Sequence[Turn], rules: Sequence[Rule], faltantes: Sequence[str], p: Patient, c: Condition):
+    total_turns = len(chat)
+    sched = scheduler()
+    append_turns(chat, c.cid)
+    next_idx = st.session_state.chat_idx + 1
+    server_typing = not st.session_state.client_typing
+    # Turno del agente desde el backend: se emite cuando el stream termina
+    streaming = (AGENT is not None and next_idx < total_turns and chat[next_idx][0] == "agent"
+                 and not st.session_state.pause)
+    handle = agent_stream(c.cid, chat, next_idx) if streaming else None
+    if handle is not None:
+        # Desde cuándo el turno espera al modelo (un prefetch suele llegar antes)
+        st.session_state.setdefault("_agent_asked", {}).setdefault((c.cid, next_idx), clock().monotonic())
+    due = handle.done if handle is not None else (
+        server_typing and not st.session_state.pause and sched.turn == next_idx and sched.is_due())
+    if due:
+        if handle is not None:
+            agent_texts()[(c.cid, next_idx)] = handle.result()
+            agent_streams().pop((c.cid, next_idx), None)
+            asked = st.session_state["_agent_asked"].pop((c.cid, next_idx), handle.finished)
+            st.session_state["_agent_wait"] = max(0.0, handle.finished - asked)
+        st.session_state.chat_idx = next_idx
+        sched.reset()
+        append_turns(chat, c.cid)
+        if next_idx + 1 >= total_turns:
+            mark_completed(p, c)
+            st.rerun()   # fin: recarga completa para detener los ticks
+        next_idx += 1
+        streaming = AGENT is not None and next_idx < total_turns and chat[next_idx][0] == "agent"
+        handle = agent_stream(c.cid, chat, next_idx) if streaming else None
+    if handle is None:
+        prefetch_agent(c.cid, chat, next_idx)
+
+    done = max(0, st.session_state.chat_idx + 1)
+    pct = int(100 * done / total_turns)
+    tcol, vcol, ccol = st.columns([0.56, 0.16, 0.28])
+    with tcol:
+        # Línea de tiempo: arrastrar salta a cualquier turno sin re-tipear
+        st.session_state.seek_turns = done
+        st.slider("Línea de tiempo (turnos)", 0, total_turns, key="seek_turns",
+                  on_change=_on_seek, args=(c.cid,))
+    with vcol:
+        st.session_state.replay_speed = st.selectbox(
+            "Repaso", REPLAY_SPEEDS, index=REPLAY_SPEEDS.index(st.session_state.replay_speed),
+            format_func=lambda x: f"×{x}",
+        )
+    with ccol:
+        html(
+            f"<div class='kpis' style='justify-content:flex-end'>"
+            f"<span class='badge'>Progreso: {pct}%</span>"
+            + (f"<span class='badge'>Modelo: espera {wait * 1000:.0f} ms</span>"
+               if (wait := st.session_state.get("_agent_wait")) is not None else "")
+            + f"<span class='badge'>Paciente: {p.nombre}</span>"
+            f"<span class='badge'>Condición: {c.titulo}</span>"
+            f"</div>"
+        )
+
+    st.markdown('<hr class="sep">', unsafe_allow_html=True)
+
+    chat_col, rep_col = st.columns([1.45, 0.95], gap="large")
+
+    with chat_col:
+        # Transcripción y burbuja en curso en dos elementos: un tick de tipeo
+        # sólo cambia la burbuja, y la transcripción (idéntica) no se vuelve a
+        # pintar. El componente del navegador (iframe) va aparte, debajo.
+        live = ""
+        bubble = None
+        if next_idx < total_turns:
+            role, txt = chat[next_idx]
+            speed = st.session_state.agent_typing_speed if role == "agent" else st.session_state.patient_typing_speed
+            delay = st.session_state.patient_thinking_delay if role == "patient" else 0.0
+            speed, delay = speed / st.session_state.replay_speed, delay / st.session_state.replay_speed
+            if st.session_state.pause:
+                live = message_html(role, "<span class='small'>[Pausado]</span>")
+            elif handle is not None:
+                # Tokens recibidos hasta ahora; el fragmento re-consulta en cada tick
+                live = message_html(role, escape_html(handle.text) + "<span class='small'> ▍</span>")
+            elif not server_typing:
+                bubble = (role, txt, next_idx, speed, delay)
+            else:
+                with prof.span("typing"):
+                    if sched.turn != next_idx:
+                        sched.arm(next_idx, txt, speed, delay, st.session_state.anim_on)
+                    shown = sched.frame()
+                    body = "<span class='small'>…</span>" if shown is None else shown
+                    live = message_html(role, body, timestamp())
+        if st.session_state.transcript_turns:
+            with prof.span("transcript"):
+                html(chatwrap_html(st.session_state.transcript_html))
+        if live:
+            html(chatwrap_html(live, " chatlive"))
+        if bubble:
+            with prof.span("typing"):
+                typing_bubble(*bubble)
+        if next_idx >= total_turns:
+            if mark_completed(p, c):
+                st.rerun()   # llegada por repaso: la barra lateral muestra la exportación
+            st.success("Entrevista completa. El reporte quedó consolidado.")
+            html("<div class='kpis'><span class='badge'>Resumen listo</span><span class='badge'>Revisa faltantes</span></div>")
+            st.balloons()
+
+    with rep_col:
+        facts = with_ehr(SCRIPTS[c.cid].facts_at(st.session_state.chat_idx), p.pid, RECORDS)
+        report_column(facts, faltantes, st.session_state.chat_idx >= len(rules), p, c)
+
+    # Los ticks del fragmento avanzan chat_idx sin pasar por el final del script
+    with prof.span("checkpoint"):
+        checkpoint_session()
+
+# ----------------------------------------------------------------------------- 
+# Modo de respuestas libres: el paciente escribe y los hechos salen del
+# autómata de palabras clave del guion, una respuesta nueva a la vez.
+# -----------------------------------------------------------------------------
+def live_facts(sc: Script) -> LiveFacts:
+    cid, lf = st.session_state.get("_live", (None, None))
+    answers = st.session_state.live_answers
+    if cid != sc.condition.cid or lf is None or lf.fed > len(answers):
+        lf = LiveFacts(sc.matcher)
+        st.session_state["_live"] = (sc.condition.cid, lf)
+    for answer in answers[lf.fed:]:
+        lf.feed(answer)
+    return lf
+
+def _on_live_answer():
+    text = (st.session_state.live_input or "").strip()
+    if text:
+        sc = SCRIPTS[st.session_state.sel_condition]
+        lf = live_facts(sc)          # al día con las respuestas previas
+        answers = st.session_state.live_answers
+        st.session_state.live_answers = answers + [text]
+        index, sid, pid, cid, i = (transcript_index(), session_id(), st.session_state.sel_patient,
+                                   sc.condition.cid, len(answers))
+        log_event("answer", pid=pid, cid=cid, idx=i, text=text)
+        index.add(sid, pid, cid, i, "answer", text)
+        for section, fact in lf.feed(text):
+            log_event("fact", pid=pid, cid=cid, idx=i, section=section, text=fact)
+            index.add(sid, pid, cid, i, "fact", fact)
+
+def live_panel(sc: Script, p: Patient, c: Condition):
+    with prof.run("fragment"), prof.span("live_panel"):
+        _live_panel(sc, p, c)
+
+def _live_panel(sc: Script, p: Patient, c: Condition):
+    questions = [txt for role, txt in sc.chat if role == "agent"]
+    answers = st.session_state.live_answers
+    done = len(answers) >= len(questions) - 1       # la última intervención es el cierre
+    with prof.span("match"):
+        lf = live_facts(sc)
+    html(
+        f"<div class='kpis' style='justify-content:flex-end'>"
+        f"<span class='badge'>Respuestas: {min(len(answers), len(questions) - 1)}/{len(questions) - 1}</span>"
+        f"<span class='badge'>Hechos extraídos: {sum(len(v) for v in lf.found.values())}</span>"
+        f"<span class='badge'>Paciente: {p.nombre}</span>"
+        f"<span class='badge'>Condición: {c.titulo}</span>"
+        f"</div>"
+    )
+    st.markdown('<hr class="sep">', unsafe_allow_html=True)
+
+    chat_col, rep_col = st.columns([1.45, 0.95], gap="large")
+    with chat_col:
+        parts = []
+        for i, q in enumerate(questions[:len(answers) + 1]):
+            parts.append(message_html("agent", q))
+            if i < len(answers):
+                parts.append(message_html("patient", escape_html(answers[i])))
+        html(f"<div class='chatwrap no-ts'>{''.join(parts)}</div>")
+        if done:
+            if mark_completed(p, c, answers):
+                st.rerun()
+            st.success("Entrevista completa. El reporte quedó consolidado.")
+        else:
+            st.chat_input("Respuesta del paciente", key="live_input", on_submit=_on_live_answer)
+    with rep_col:
+        report_column(with_ehr(lf.facts(), p.pid, RECORDS), sc.faltantes, done, p, c)
+
+    # Las respuestas llegan por reruns del fragmento: se guardan aquí mismo
+    with prof.span("checkpoint"):
+        checkpoint_session()
+
 if st.session_state.step == "convo":
-    p = next(x for x in PACIENTES if x.pid == st.session_state.sel_patient)
-    c = next(x for x in CONDICIONES if x.cid == st.session_state.sel_condition)
-    chat, rules, faltantes = SCRIPTS[st.session_state.sel_condition]()
+    p = CAT_PACIENTES.get(st.session_state.sel_patient)
+    c = CAT_CONDICIONES.get(st.session_state.sel_condition)
+    sc = SCRIPTS[st.session_state.sel_condition]
+    chat, rules, faltantes = sc.chat, sc.rules, sc.faltantes
     total_turns = len(chat)
+    live_mode = st.session_state.live_mode and sc.matcher is not None
 
     headL, headR = st.columns([2.8, 1.2], gap="large")
     with headL:
@@ -832,75 +1097,42 @@ if st.session_state.step == "convo":
         cols = st.columns(3)
         with cols[0]:
             if st.button("◀ Volver", use_container_width=True):
+                scheduler().reset(); cancel_streams()
+                log_event("leave", cid=c.cid, idx=st.session_state.chat_idx)
                 st.session_state.step = "intro"; st.rerun()
         with cols[1]:
             if st.button("🔁 Reiniciar", use_container_width=True):
+                scheduler().reset(); cancel_streams(); reset_transcript()
+                st.session_state["_agent_texts"] = {}
+                st.session_state.live_answers = []
+                st.session_state.pop("_live", None)
+                log_event("reset", cid=c.cid, idx=st.session_state.chat_idx)
                 st.session_state.chat_idx = -1; st.session_state.pause = False; st.rerun()
         with cols[2]:
             if not st.session_state.pause:
                 if st.button("⏸ Pausa", use_container_width=True):
+                    scheduler().reset(); cancel_streams()
+                    log_event("pause", cid=c.cid, idx=st.session_state.chat_idx)
                     st.session_state.pause = True; st.rerun()
             else:
                 if st.button("▶ Reanudar", use_container_width=True):
+                    log_event("resume", cid=c.cid, idx=st.session_state.chat_idx)
                     st.session_state.pause = False; st.rerun()
 
-    done = max(0, st.session_state.chat_idx + 1)
-    pct = int(100 * done / total_turns)
-    pcol, ccol = st.columns([0.72, 0.28])
-    with pcol:
-        st.progress(pct, text=f"Progreso: {pct}%")
-    with ccol:
-        st.markdown(
-            f"<div class='kpis' style='justify-content:flex-end'>"
-            f"<span class='badge'>Paciente: {p.nombre}</span>"
-            f"<span class='badge'>Condición: {c.titulo}</span>"
-            f"</div>",
-            unsafe_allow_html=True,
-        )
-
-    st.markdown('<hr class="sep">', unsafe_allow_html=True)
-
-    chat_col, rep_col = st.columns([1.45, 0.95], gap="large")
-
-    with chat_col:
-        st.markdown('<div class="chatwrap">', unsafe_allow_html=True)
-
-        # Mensajes ya emitidos
-        for i in range(st.session_state.chat_idx + 1):
-            role, txt = chat[i]
-            render_message(role, txt)
-
-        # Próximo mensaje con pausas y tipeo
-        next_idx = st.session_state.chat_idx + 1
-        if next_idx < total_turns:
-            role, txt = chat[next_idx]
-            if not st.session_state.pause:
-                if role == "patient":
-                    time.sleep(max(0.0, st.session_state.patient_thinking_delay))
-                ph = render_typing(role)
-                speed = st.session_state.agent_typing_speed if role == "agent" else st.session_state.patient_typing_speed
-                typewriter(ph, txt, speed)
-                st.session_state.chat_idx = next_idx
-                time.sleep(0.06)
-                st.rerun()
-            else:
-                who = "Asistente" if role == "agent" else "Paciente"
-                klass = "agent" if role == "agent" else "patient"
-                st.markdown(f"<div class='msg {klass}'><b>{who}:</b> <span class='small'>[Pausado]</span></div>", unsafe_allow_html=True)
+    # Sólo el tipeo del lado del servidor necesita ticks; el componente del
+    # navegador re-ejecuta el fragmento al avisar que terminó.
+    ticking = (not live_mode and not st.session_state.pause
+               and (not st.session_state.client_typing or AGENT is not None)
+               and st.session_state.chat_idx + 1 < total_turns)
+    # Reanudación: la transcripción sale entera de lo precalculado
+    if st.session_state.pop("_resume_seek", False):
+        seek_to(sc.condition.cid, st.session_state.chat_idx, reason="restore")
+
+    with prof.span("view:convo"):
+        if live_mode:
+            st.fragment(live_panel)(sc, p, c)
         else:
-            st.success("Entrevista completa. El reporte quedó consolidado.")
-            st.markdown("<div class='kpis'><span class='badge'>Resumen listo</span><span class='badge'>Revisa faltantes</span></div>", unsafe_allow_html=True)
-            st.balloons()
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with rep_col:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        title("Reporte generado", f"Paciente: {p.nombre} • Condición: {c.titulo}")
-        render_report(st.session_state.chat_idx, rules, faltantes)
-        md = compose_markdown(st.session_state.chat_idx, rules, p.nombre, c.titulo)
-        st.download_button("⬇️ Exportar (.md)", data=md.encode("utf-8"), file_name=f"reporte_{p.pid}_{c.cid}.md", mime="text/markdown", use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+            st.fragment(convo_panel, run_every=SCHED_TICK if ticking else None)(chat, rules, faltantes, p, c)
 
     st.markdown('<hr class="sep">', unsafe_allow_html=True)
 
@@ -912,6 +1144,78 @@ if st.session_state.step == "convo":
 - Mantuvimos una estética sobria y moderna para uso profesional.
 """)
 
+# -----------------------------------------------------------------------------
+# Vista de analítica (bitácora de eventos → DataFrames)
+# -----------------------------------------------------------------------------
+@st.cache_resource
+def analytics() -> Optional[Analytics]:
+    # Una por proceso: cada visita sólo convierte los eventos nuevos
+    url = events_url()
+    return Analytics(url, SCRIPTS) if url else None
+
+def condition_titles(df: pd.DataFrame) -> pd.DataFrame:
+    return df.rename(index=lambda cid: SCRIPTS[cid].condition.titulo if cid in SCRIPTS else cid, level="cid")
+
+def analytics_view():
+    an = analytics()
+    if an is None:
+        st.info("La bitácora está desactivada (PRECONSULTA_EVENTS vacío); no hay datos que analizar.")
+        return
+    if event_log() is not None:
+        event_log().flush(timeout=1.0)      # lo encolado por esta sesión, ya en disco
+    with prof.span("refresh"):
+        an.refresh()
+    with prof.span("summary"):
+        res = an.summary()
+    comp = res["completion"]
+    html(
+        f"<div class='kpis'>"
+        f"<span class='badge'>Entrevistas: {int(comp['entrevistas'].sum()):,}</span>"
+        f"<span class='badge'>Completadas: {int(comp['completadas'].sum()):,}</span>"
+        f"<span class='badge'>Eventos: {len(an.frame):,}</span>"
+        + (f"<span class='badge'>Líneas rotas saltadas: {an.bad_lines:,}</span>" if an.bad_lines else "")
+        + "</div>"
+    )
+    pct = st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format="percent")
+    left, right = st.columns(2, gap="large")
+    with left:
+        st.markdown("**Finalización por condición**")
+        st.dataframe(condition_titles(comp), width="stretch", column_config={"tasa": pct})
+        st.markdown("**Turno promedio del primer hecho por sección**")
+        st.dataframe(condition_titles(res["sections"]).round(1), width="stretch")
+    with right:
+        st.markdown("**Latencia entre turnos (s)**")
+        st.dataframe(condition_titles(res["latency"]).round(2), width="stretch")
+        st.markdown("**Checklist de faltantes más frecuente**")
+        st.dataframe(res["checklist"], width="stretch", column_config={"porcentaje": pct})
+
+if st.session_state.step == "analytics":
+    headL, headR = st.columns([2.8, 1.2], gap="large")
+    with headL:
+        title("Analítica de entrevistas", "Sobre la bitácora de eventos, con refresco incremental")
+    with headR:
+        if st.button("◀ Volver", use_container_width=True):
+            st.session_state.step = st.session_state.pop("_analytics_from", "select"); st.rerun()
+    with prof.span("view:analytics"):
+        analytics_view()
+elif st.sidebar.button("📊 Analítica", use_container_width=True):
+    st.session_state["_analytics_from"] = st.session_state.step
+    st.session_state.step = "analytics"; st.rerun()
+
+# Exportación en lote: el zip se arma al hacer clic, un reporte a la vez
+if st.session_state.completed:
+    completed = dict(st.session_state.completed)
+    st.sidebar.download_button(
+        f"⬇️ Exportar completadas ({len(completed)}, .zip)",
+        data=logged_export(lambda: completed_zip(completed), format="zip", interviews=len(completed)),
+        file_name="preconsultas.zip", mime="application/zip", use_container_width=True,
+    )
+
+with prof.span("checkpoint"):
+    checkpoint_session()
+
+prof.end()
+
 # ----------------------------------------------------------------------------- 
 # Fin de la Parte 2/2
 # -----------------------------------------------------------------------------
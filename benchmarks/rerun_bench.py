@@ -0,0 +1,247 @@
+# Benchmark de reruns de app.py con streamlit.testing.v1.AppTest.
+#
+# Recorre select → intro → convo (para cada condición) con la animación
+# apagada y un reloj virtual, más el select con un roster grande, unos ticks
+# de tipeo animado, una entrevista con el tipeo en el navegador (el modo por
+# defecto) y la analítica sobre la bitácora de la corrida, y
+# registra por paso el tiempo de pared del
+# rerun, el número de elementos emitidos, los bytes de HTML/CSS y los que
+# cambian entre ticks de una misma sesión (tipeo en curso). Compara
+# contra benchmarks/baseline.json y contra ELEMENT_BUDGET, y sale con
+# código 1 ante regresiones.
+#
+#   python benchmarks/rerun_bench.py            # compara contra la línea base
+#   python benchmarks/rerun_bench.py --update   # reescribe la línea base
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from preconsulta import VirtualClock, load_scripts  # noqa: E402
+
+APP = os.path.join(ROOT, "app.py")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+Metrics = Dict[str, float]
+
+# Tope de elementos en el área principal por vista (sin la barra lateral).
+# Cada tarjeta o panel debe emitirse como un solo elemento. El select
+# paginado (roster grande) suma buscador, paginador y una página completa.
+ELEMENT_BUDGET = {"select": 50, "intro": 18, "convo": 36, "typing": 36, "client": 36, "analytics": 20}
+ROSTER_SIZE = 20000
+
+def _nodes(node) -> Iterator:
+    for child in getattr(node, "children", {}).values():
+        yield child
+        yield from _nodes(child)
+
+def measure(at: AppTest, seen: Optional[List[str]] = None) -> Metrics:
+    # seen: el HTML del rerun anterior de la misma sesión. changed_bytes cuenta
+    # sólo los elementos que cambiaron: los idénticos los cubre el caché de
+    # mensajes de Streamlit y el navegador no los vuelve a pintar.
+    t0 = time.perf_counter()
+    at.run()
+    wall = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    metrics = measure_tree(at, seen)
+    metrics["wall_ms"] = wall
+    return metrics
+
+def measure_tree(at: AppTest, seen: Optional[List[str]] = None) -> Metrics:
+    nodes = list(_nodes(at._tree))
+    values = [n.value for n in nodes if type(n).__name__ in ("Markdown", "Html")]
+    sizes = [len(v.encode("utf-8")) for v in values]
+    changed = sum(sizes) if seen is None else sum(
+        size for i, (v, size) in enumerate(zip(values, sizes)) if i >= len(seen) or seen[i] != v)
+    if seen is not None:
+        seen[:] = values
+    return dict(wall_ms=0.0, elements=len(nodes), main_elements=len(list(_nodes(at.main))),
+                html_bytes=sum(sizes), changed_bytes=changed)
+
+def finish_typing(at: AppTest, clock: VirtualClock) -> Metrics:
+    # Tipeo en el navegador (el modo por defecto): el componente avisa el fin
+    # del turno con su valor. AppTest no lo simula, así que se inyecta en los
+    # WidgetStates del próximo rerun, como lo mandaría el navegador.
+    components = [n for n in _nodes(at._tree) if getattr(n, "type", "") == "component_instance"]
+    if not components:
+        raise RuntimeError("no se pintó el componente de tipeo")
+    idx = at.session_state.chat_idx
+    turn = json.loads(components[-1].proto.json_args)["turn"]
+    states = at._tree.get_widget_states()
+    states.widgets.append(WidgetState(id=components[-1].proto.id, json_value=json.dumps(turn)))
+    clock.advance(60.0)
+    t0 = time.perf_counter()
+    at._run(states)
+    wall = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    if at.session_state.chat_idx <= idx:
+        raise RuntimeError(f"el turno {turn} terminó en el navegador pero chat_idx quedó en {idx}")
+    metrics = measure_tree(at)
+    metrics["wall_ms"] = wall
+    return metrics
+
+def new_app(clock: VirtualClock, **state) -> AppTest:
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state["anim_on"] = False
+    at.session_state["client_typing"] = False
+    at.session_state["_clock"] = clock     # ritmo y horas sin tiempo de pared
+    for k, v in state.items():
+        at.session_state[k] = v
+    return at
+
+def write_roster(path: str, n: int):
+    # Roster sintético para medir que el select no crece con el catálogo
+    nombres = ["Ana", "Luis", "María", "José", "Lucía", "Pedro"]
+    apellidos = ["Núñez", "Gómez", "Pérez", "Rodríguez", "Fernández", "Sánchez"]
+    with open(path, "w", encoding="utf-8", newline="") as fh:
+        w = csv.writer(fh)
+        w.writerow(["pid", "nombre", "edad", "sexo", "condicion_base"])
+        for i in range(n):
+            w.writerow([f"p{i:06d}", f"{nombres[i % 6]} {apellidos[i // 6 % 6]}", 20 + i % 60,
+                        "Femenino" if i % 2 else "Masculino", "Asma"])
+
+def summarize(samples: Sequence[Metrics]) -> Metrics:
+    return dict(
+        wall_ms=round(statistics.median(s["wall_ms"] for s in samples), 2),
+        elements=max(s["elements"] for s in samples),
+        main_elements=max(s["main_elements"] for s in samples),
+        html_bytes=max(s["html_bytes"] for s in samples),
+        changed_bytes=max(s["changed_bytes"] for s in samples),
+        reruns=len(samples),
+    )
+
+def run_suite(repeat: int = 3) -> Dict[str, Metrics]:
+    # Bitácora y checkpoints propios: la analítica resume sólo lo que emite
+    # esta corrida y ninguna sesión se retoma de una corrida anterior
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(PRECONSULTA_EVENTS=os.path.join(tmp, "eventos.jsonl"),
+                   PRECONSULTA_CHECKPOINTS=os.path.join(tmp, "sesiones.sqlite3"))
+        saved = {k: os.environ.get(k) for k in env}
+        os.environ.update(env)
+        try:
+            return _run_suite(repeat)
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+def _run_suite(repeat: int) -> Dict[str, Metrics]:
+    clock = VirtualClock()
+    new_app(clock).run()    # calentamiento: imports y cachés de recursos
+    scripts = load_scripts()
+    pid = "nvelarde"
+    results: Dict[str, Metrics] = {}
+
+    results["select"] = summarize([measure(new_app(clock)) for _ in range(repeat)])
+    with tempfile.TemporaryDirectory() as tmp:
+        roster = os.path.join(tmp, "roster.csv")
+        write_roster(roster, ROSTER_SIZE)
+        os.environ["PRECONSULTA_PACIENTES"] = roster
+        try:
+            new_app(clock).run()    # construye el catálogo (una vez por proceso)
+            results[f"select:roster{ROSTER_SIZE // 1000}k"] = summarize([measure(new_app(clock)) for _ in range(repeat)])
+        finally:
+            del os.environ["PRECONSULTA_PACIENTES"]
+    for cid in scripts:
+        intro = [measure(new_app(clock, step="intro", sel_patient=pid, sel_condition=cid)) for _ in range(repeat)]
+        results[f"intro:{cid}"] = summarize(intro)
+
+        # Un rerun por turno: el reloj virtual salta lo suficiente para que
+        # cada tick emita exactamente el turno armado en el anterior.
+        at = new_app(clock, step="convo", sel_patient=pid, sel_condition=cid)
+        samples: List[Metrics] = []
+        for _ in range(len(scripts[cid].chat) + 1):
+            samples.append(measure(at))
+            clock.advance(60.0)
+        results[f"convo:{cid}"] = summarize(samples)
+
+    # Tipeo del lado del servidor a mitad de la entrevista más larga: cada
+    # tick debe cambiar sólo la burbuja en curso, no toda la transcripción
+    cid = max(scripts, key=lambda k: len(scripts[k].chat))
+    at = new_app(clock, step="convo", sel_patient=pid, sel_condition=cid, anim_on=True)
+    for _ in range(len(scripts[cid].chat) // 2):
+        at.run()
+        clock.advance(60.0)
+    seen: List[str] = []
+    measure(at, seen)
+    samples = []
+    for _ in range(repeat * 3):
+        clock.advance(0.05)
+        samples.append(measure(at, seen))
+    results[f"typing:{cid}"] = summarize(samples)
+
+    # Entrevista completa con el tipeo en el navegador: cada turno debe
+    # avanzar chat_idx al recibir el aviso del componente
+    cid = min(scripts, key=lambda k: len(scripts[k].chat))
+    at = new_app(clock, step="convo", sel_patient=pid, sel_condition=cid, client_typing=True)
+    at.run()
+    samples = [finish_typing(at, clock) for _ in range(len(scripts[cid].chat))]
+    results[f"client:{cid}"] = summarize(samples)
+    results["analytics"] = summarize([measure(new_app(clock, step="analytics")) for _ in range(repeat)])
+    return results
+
+def compare(results: Dict[str, Metrics], baseline: Dict[str, Metrics],
+            size_tol: float, wall_tol: float, wall_slack_ms: float) -> List[str]:
+    problems = []
+    for step, cur in results.items():
+        budget = ELEMENT_BUDGET.get(step.split(":")[0])
+        if budget is not None and cur["main_elements"] > budget:
+            problems.append(f"{step}: {cur['main_elements']} elementos en el área principal (tope {budget})")
+    for step, base in baseline.items():
+        cur = results.get(step)
+        if cur is None:
+            problems.append(f"{step}: falta en esta corrida")
+            continue
+        for key in ("elements", "main_elements", "html_bytes", "changed_bytes"):
+            if key in base and cur[key] > base[key] * (1 + size_tol):
+                problems.append(f"{step}: {key} {base[key]} → {cur[key]}")
+        if cur["wall_ms"] > base["wall_ms"] * wall_tol + wall_slack_ms:
+            problems.append(f"{step}: wall_ms {base['wall_ms']:.1f} → {cur['wall_ms']:.1f}")
+    return problems
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark de reruns de app.py (AppTest).")
+    ap.add_argument("--repeat", type=int, default=3, help="corridas por paso sin entrevista")
+    ap.add_argument("--update", action="store_true", help="reescribe benchmarks/baseline.json")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--size-tolerance", type=float, default=0.05, help="holgura relativa para elementos/bytes")
+    ap.add_argument("--wall-tolerance", type=float, default=2.0, help="factor permitido sobre wall_ms")
+    ap.add_argument("--wall-slack-ms", type=float, default=25.0, help="holgura absoluta sobre wall_ms")
+    args = ap.parse_args(argv)
+
+    results = run_suite(args.repeat)
+    print(f"{'paso':<18}{'wall ms':>10}{'elementos':>11}{'principal':>11}{'html bytes':>12}{'cambian':>9}{'reruns':>8}")
+    for step, m in results.items():
+        print(f"{step:<18}{m['wall_ms']:>10.1f}{m['elements']:>11}{m['main_elements']:>11}{m['html_bytes']:>12}"
+              f"{m['changed_bytes']:>9}{m['reruns']:>8}")
+
+    if args.update or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2, ensure_ascii=False)
+            fh.write("\n")
+        print(f"línea base escrita en {os.path.relpath(args.baseline, ROOT)}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    problems = compare(results, baseline, args.size_tolerance, args.wall_tolerance, args.wall_slack_ms)
+    for p in problems:
+        print(f"REGRESIÓN {p}", file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# Motor del agente de preconsulta: modelo, guiones, reporte y ritmo.
+# No importa Streamlit; app.py es sólo una vista sobre este paquete.
+from .checkpoint import CheckpointStore
+from .clock import REAL_CLOCK, Clock, RealClock, VirtualClock
+from .events import EventLog, EventSink, JSONLSink, SQLiteSink, open_sink, read_events
+from .export import write_zip
+from .models import PACIENTES, SECTION_ORDER, Condition, Patient, Rule, Script, Turn
+from .profiler import Profiler
+from .pacing import TYPING_FPS, TYPING_MAX_FRAMES, TurnScheduler, replay, typing_frames
+from .report import EHR_SEED, FactIndex, compose_json, compose_markdown, ehr_for, seed_facts, with_ehr
+from .search import Hit, LogFollower, TranscriptIndex
+from .scripts import GUIONES_DIR, ScriptError, compile_script, load_scripts
+from .state import FileBackend, RedisBackend, SQLiteBackend, StateBackend, open_backend
+
+__all__ = [
+    "CheckpointStore",
+    "REAL_CLOCK", "Clock", "RealClock", "VirtualClock",
+    "EventLog", "EventSink", "JSONLSink", "SQLiteSink", "open_sink", "read_events",
+    "write_zip",
+    "PACIENTES", "SECTION_ORDER", "Condition", "Patient", "Rule", "Script", "Turn",
+    "Profiler",
+    "TYPING_FPS", "TYPING_MAX_FRAMES", "TurnScheduler", "replay", "typing_frames",
+    "EHR_SEED", "FactIndex", "compose_json", "compose_markdown", "ehr_for", "seed_facts", "with_ehr",
+    "Hit", "LogFollower", "TranscriptIndex",
+    "GUIONES_DIR", "ScriptError", "compile_script", "load_scripts",
+    "FileBackend", "RedisBackend", "SQLiteBackend", "StateBackend", "open_backend",
+]
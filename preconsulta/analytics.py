@@ -0,0 +1,96 @@
+# Analítica de entrevistas sobre la bitácora (events.py) con pandas. Los
+# eventos se cargan en un DataFrame columnar que sólo crece con lo nuevo
+# (mismo offset que el índice de búsqueda); las métricas salen de group-bys
+# vectorizados y se recalculan sólo si llegaron eventos desde la última vez.
+import threading
+from typing import Dict, Mapping, Optional, Sequence
+
+import pandas as pd
+
+from .events import Event, read_events
+from .models import SECTION_ORDER, Script
+
+KINDS = ("start", "turn", "fact", "answer", "complete")
+COLUMNS = ["ts", "session", "kind", "pid", "cid", "idx", "role", "section", "skipped"]
+INTERVIEW = ["session", "pid", "cid"]        # una entrevista: sesión × paciente × guion
+PERCENTILES = (0.5, 0.9, 0.99)
+
+def events_frame(events: Sequence[Event]) -> pd.DataFrame:
+    # Sólo las columnas que usan las métricas; los textos quedan en la bitácora
+    df = pd.DataFrame([e for e in events if e.get("kind") in KINDS], columns=COLUMNS)
+    df["ts"] = pd.to_datetime(df["ts"], format="ISO8601", errors="coerce")
+    df["idx"] = pd.to_numeric(df["idx"], errors="coerce")
+    keys = ["session", "kind", "pid", "cid", "role", "section"]
+    df[keys] = df[keys].fillna("").astype(str)
+    df["skipped"] = df["skipped"].fillna(False).astype(bool)       # turnos saltados con un seek
+    return df
+
+def completion(df: pd.DataFrame) -> pd.DataFrame:
+    started = df.loc[df["kind"] != "fact", INTERVIEW].drop_duplicates()
+    done = pd.MultiIndex.from_frame(df.loc[df["kind"] == "complete", INTERVIEW])
+    started = started.assign(completada=pd.MultiIndex.from_frame(started).isin(done))
+    out = started.groupby("cid").agg(entrevistas=("completada", "size"), completadas=("completada", "sum"))
+    out["tasa"] = out["completadas"] / out["entrevistas"]
+    return out
+
+def section_turns(df: pd.DataFrame) -> pd.DataFrame:
+    # Turno promedio en que cada sección recibe su primer hecho. Las entrevistas
+    # con respuestas libres no tienen turnos del guion: se excluyen.
+    free = pd.MultiIndex.from_frame(df.loc[df["kind"] == "answer", INTERVIEW])
+    facts = df[df["kind"] == "fact"]
+    facts = facts[~pd.MultiIndex.from_frame(facts[INTERVIEW]).isin(free)]
+    first = facts.groupby(INTERVIEW + ["section"])["idx"].min() + 1     # turnos desde 1
+    avg = first.groupby(level=["cid", "section"]).mean().unstack("section")
+    return avg.reindex(columns=[s for s in SECTION_ORDER if s in avg.columns])
+
+def checklist(df: pd.DataFrame, scripts: Mapping[str, Script]) -> pd.DataFrame:
+    # Cada entrevista terminada deja su checklist de faltantes para la consulta
+    items = pd.DataFrame([(cid, f) for cid, sc in scripts.items() for f in sc.faltantes],
+                         columns=["cid", "faltante"])
+    done = completion(df)["completadas"].rename("veces").reset_index()
+    freq = items.merge(done, on="cid").groupby("faltante")["veces"].sum()
+    total = max(1, int(done["veces"].sum()))
+    return (freq.to_frame().assign(porcentaje=freq / total)
+            .sort_values("veces", ascending=False).query("veces > 0"))
+
+def turn_latency(df: pd.DataFrame) -> pd.DataFrame:
+    # Segundos entre un turno y el siguiente de la misma entrevista (sin saltos
+    # por repaso o reinicio, ni turnos saltados), en percentiles por condición y rol
+    turns = df[(df["kind"] == "turn") & ~df["skipped"]].sort_values(INTERVIEW + ["ts"], kind="stable")
+    prev = turns.groupby(INTERVIEW)[["ts", "idx"]].shift()
+    step = turns["idx"] == prev["idx"] + 1
+    lat = turns.loc[step, ["cid", "role"]].assign(latencia=(turns["ts"] - prev["ts"])[step].dt.total_seconds())
+    out = lat.groupby(["cid", "role"])["latencia"].quantile(list(PERCENTILES)).unstack()
+    out.columns = [f"p{round(q * 100)}" for q in out.columns]
+    return out
+
+class Analytics:
+    def __init__(self, url: str, scripts: Mapping[str, Script]):
+        self.url = url
+        self.scripts = scripts
+        self.offset = 0
+        self.bad_lines = 0         # líneas rotas de la bitácora, saltadas
+        self.frame = events_frame([])
+        self._cache: Optional[Dict[str, pd.DataFrame]] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        # Sólo se leen y convierten los eventos anexados desde la última vez
+        with self._lock:
+            events, self.offset = read_events(self.url, self.offset, on_bad=self._bad)
+            new = events_frame(events)
+            if len(new):
+                self.frame = new if self.frame.empty else pd.concat([self.frame, new], ignore_index=True)
+                self._cache = None
+            return len(new)
+
+    def _bad(self, line: bytes):
+        self.bad_lines += 1
+
+    def summary(self) -> Dict[str, pd.DataFrame]:
+        with self._lock:
+            if self._cache is None:
+                df = self.frame
+                self._cache = dict(completion=completion(df), sections=section_turns(df),
+                                   checklist=checklist(df, self.scripts), latency=turn_latency(df))
+            return self._cache
@@ -0,0 +1,252 @@
+# Backend conversacional: el texto de cada turno del agente puede venir de un
+# servidor de modelo que lo transmite token a token. Todo corre en un event
+# loop de fondo (uno por proceso) para que el rerun nunca espere la red: la
+# vista consulta un StreamHandle en cada tick y pinta lo recibido hasta ahí.
+#
+# Protocolo: POST {url}/v1/turn con JSON {cid, turn, history, fallback};
+# la respuesta es NDJSON, una línea {"token": "..."} por fragmento.
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Tuple
+from urllib.parse import urlsplit
+
+from .clock import REAL_CLOCK, Clock
+from .models import Turn
+
+@dataclass(frozen=True)
+class TurnRequest:
+    cid: str
+    turn: int
+    history: Tuple[Turn, ...]
+    fallback: str                  # texto del guion, por si el backend falla
+
+class AgentBackend(Protocol):
+    def stream(self, request: TurnRequest) -> AsyncIterator[str]: ...
+    async def aclose(self) -> None: ...
+
+class BackendError(RuntimeError):
+    pass
+
+# -----------------------------------------------------------------------------
+# HTTP/1.1 con conexiones keep-alive reutilizadas (sólo biblioteca estándar)
+# -----------------------------------------------------------------------------
+class ConnectionPool:
+    def __init__(self, host: str, port: int, size: int = 8, connect_timeout: float = 3.0):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.opened = 0
+        self.reused = 0
+        self.retried = 0           # keep-alive cerradas por el servidor, reintentadas
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self, fresh: bool = False) -> Tuple[Tuple[asyncio.StreamReader, asyncio.StreamWriter], bool]:
+        # (conexión, si es reutilizada); fresh fuerza una conexión nueva
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        await self._slots.acquire()
+        while self._idle and not fresh:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return (reader, writer), True
+            writer.close()
+        try:
+            conn = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.opened += 1
+        return conn, False
+
+    def release(self, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter], reusable: bool):
+        # Una respuesta leída a medias (cancelación, error) no se reutiliza
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        if self._slots is not None:
+            self._slots.release()
+
+    async def aclose(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+class StaleConnection(BackendError):
+    # El servidor cerró la conexión antes de responder un solo byte
+    pass
+
+async def _read_headers(reader: asyncio.StreamReader, status_line: bytes) -> Tuple[int, Dict[str, str]]:
+    status = int(status_line.split()[1])
+    headers: Dict[str, str] = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            return status, headers
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+async def _iter_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await reader.readline()
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    else:
+        yield await reader.readexactly(int(headers.get("content-length", "0")))
+
+class HTTPBackend:
+    def __init__(self, url: str, pool_size: int = 8):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"sólo se admite http:// (recibido {url!r})")
+        self.path = parts.path.rstrip("/") + "/v1/turn"
+        self.netloc = parts.netloc
+        self.pool = ConnectionPool(parts.hostname or "localhost", parts.port or 80, size=pool_size)
+
+    async def _send(self, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter], body: bytes) -> bytes:
+        # Envía el pedido y devuelve la línea de estado
+        reader, writer = conn
+        try:
+            writer.write(
+                f"POST {self.path} HTTP/1.1\r\nHost: {self.netloc}\r\nConnection: keep-alive\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+            status_line = await reader.readline()
+        except ConnectionError as exc:
+            raise StaleConnection(f"conexión cerrada por el servidor ({exc})") from exc
+        if not status_line:
+            raise StaleConnection("conexión cerrada por el servidor")
+        return status_line
+
+    async def stream(self, request: TurnRequest) -> AsyncIterator[str]:
+        body = json.dumps(dict(cid=request.cid, turn=request.turn, history=request.history,
+                               fallback=request.fallback), ensure_ascii=False).encode("utf-8")
+        conn: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+        conn, reused = await self.pool.acquire()
+        clean = False
+        try:
+            try:
+                status_line = await self._send(conn, body)
+            except StaleConnection:
+                # Una keep-alive que el servidor cerró entre pedidos: un solo
+                # reintento con una conexión nueva (no llegó ningún byte)
+                if not reused:
+                    raise
+                self.pool.retried += 1
+                self.pool.release(conn, False)
+                conn = None
+                conn, _ = await self.pool.acquire(fresh=True)
+                status_line = await self._send(conn, body)
+            reader = conn[0]
+            status, headers = await _read_headers(reader, status_line)
+            if status != 200:
+                raise BackendError(f"HTTP {status}")
+            buf = b""
+            async for data in _iter_body(reader, headers):
+                buf += data
+                *lines, buf = buf.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        token = json.loads(line).get("token", "")
+                        if token:
+                            yield token
+            clean = headers.get("connection", "").lower() != "close"
+        finally:
+            if conn is not None:
+                self.pool.release(conn, clean)
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+# -----------------------------------------------------------------------------
+# Event loop de fondo y handles de stream consultables desde el rerun
+# -----------------------------------------------------------------------------
+class StreamHandle:
+    # started, first_token y finished se miden con el reloj de la sesión (el
+    # mismo de la vista); los plazos de red del runner, con el del sistema.
+    def __init__(self, request: TurnRequest, clock: Clock = REAL_CLOCK):
+        self.request = request
+        self.clock = clock
+        self.parts: List[str] = []
+        self.done = False
+        self.error = ""
+        self.cancelled = False
+        self.started = clock.monotonic()
+        self.first_token: Optional[float] = None     # segundos hasta el primer token
+        self.finished: Optional[float] = None        # clock.monotonic() al terminar
+        self._future: Optional[Future] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def result(self) -> str:
+        # Texto final; si el backend falló o no dijo nada, el del guion
+        text = self.text.strip()
+        ok = self.done and not self.error and not self.cancelled
+        return text if ok and text else self.request.fallback
+
+    def cancel(self):
+        if self._future is not None and not self.done:
+            self._future.cancel()
+
+class StreamRunner:
+    def __init__(self, backend: AgentBackend, timeout: float = 30.0, idle_timeout: float = 10.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="agent-backend", daemon=True)
+        self._thread.start()
+
+    def start(self, request: TurnRequest, clock: Clock = REAL_CLOCK) -> StreamHandle:
+        handle = StreamHandle(request, clock)
+        handle._future = asyncio.run_coroutine_threadsafe(self._pump(handle), self.loop)
+        return handle
+
+    async def _pump(self, handle: StreamHandle):
+        # Plazo total y plazo entre tokens; cancelar corta la conexión
+        deadline = time.monotonic() + self.timeout
+        stream = self.backend.stream(handle.request)
+        try:
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise asyncio.TimeoutError
+                try:
+                    token = await asyncio.wait_for(stream.__anext__(), min(left, self.idle_timeout))
+                except StopAsyncIteration:
+                    break
+                if handle.first_token is None:
+                    handle.first_token = handle.clock.monotonic() - handle.started
+                handle.parts.append(token)
+        except asyncio.CancelledError:
+            handle.cancelled = True
+            raise
+        except asyncio.TimeoutError:
+            handle.error = "tiempo de espera agotado"
+        except Exception as exc:
+            handle.error = f"{type(exc).__name__}: {exc}"
+        finally:
+            handle.finished = handle.clock.monotonic()
+            handle.done = True
+            await stream.aclose()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.backend.aclose(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+def open_agent_backend(url: str, **kwargs) -> StreamRunner:
+    return StreamRunner(HTTPBackend(url), **kwargs)
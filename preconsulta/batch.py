@@ -0,0 +1,160 @@
+# Generación masiva de reportes sin UI: todos los guiones × todos los pacientes.
+#
+#   python -m preconsulta.batch --out reportes/ --workers 8
+#   python -m preconsulta.batch --patients pacientes.csv --conditions ss,mig
+#   python -m preconsulta.batch --transcript    # + transcripción con horas virtuales
+#   python -m preconsulta.batch --zip reportes.zip
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .clock import VirtualClock
+from .export import write_zip
+from .models import PACIENTES, Patient, Script
+from .pacing import replay
+from .records import RecordStore
+from .report import Records, compose_markdown, with_ehr
+from .scripts import GUIONES_DIR, load_scripts
+
+Job = Tuple[str, str, str]     # (pid, nombre, cid)
+
+_SCRIPTS: Dict[str, Script] = {}
+_OUT_DIR = ""
+_RECORDS: Optional[RecordStore] = None
+_TRANSCRIPT = False
+
+def load_patients(path: str) -> List[Patient]:
+    # CSV con cabecera, JSON (lista de objetos) con los campos de Patient
+    # o un almacén de expedientes (.sqlite3/.db, ver records.py)
+    if path.endswith((".sqlite3", ".db")):
+        return list(RecordStore(path).patients())
+    with open(path, encoding="utf-8", newline="") as fh:
+        if path.endswith(".json"):
+            rows = json.load(fh)
+        else:
+            rows = list(csv.DictReader(fh))
+    return [
+        Patient(str(r["pid"]), str(r["nombre"]), int(r.get("edad") or 0),
+                str(r.get("sexo", "")), str(r.get("condicion_base", "")))
+        for r in rows
+    ]
+
+def report_for(sc: Script, p_name: str, pid: Optional[str] = None, records: Optional[Records] = None) -> str:
+    # Reporte con la entrevista completa, sin pausas ni tipeo
+    facts = with_ehr(sc.facts_at(len(sc.chat) - 1), pid, records)
+    return compose_markdown(facts, p_name, sc.condition.titulo)
+
+def transcript_for(sc: Script) -> str:
+    # Entrevista con el ritmo por defecto de la app sobre un reloj virtual:
+    # mismas horas en cada corrida, sin esperar el tipeo.
+    lines = ["\n## Transcripción"]
+    for at, role, text in replay(sc.chat, VirtualClock()):
+        who = "Asistente" if role == "agent" else "Paciente"
+        lines.append(f"- `{at:%H:%M:%S}` **{who}:** {text}")
+    return "\n".join(lines)
+
+def _init_worker(guiones_dir: str, out_dir: str, ehr: str = "", transcript: bool = False):
+    global _SCRIPTS, _OUT_DIR, _RECORDS, _TRANSCRIPT
+    _SCRIPTS = load_scripts(guiones_dir)
+    _OUT_DIR = out_dir
+    _RECORDS = RecordStore(ehr) if ehr else None
+    _TRANSCRIPT = transcript
+
+def _render(job: Job) -> Tuple[str, str]:
+    pid, nombre, cid = job
+    md = report_for(_SCRIPTS[cid], nombre, pid, _RECORDS)
+    if _TRANSCRIPT:
+        md += "\n" + transcript_for(_SCRIPTS[cid])
+    return f"reporte_{pid}_{cid}.md", md
+
+def _run_job(job: Job) -> int:
+    name, md = _render(job)
+    data = md.encode("utf-8")
+    with open(os.path.join(_OUT_DIR, name), "wb") as fh:
+        fh.write(data)
+    return len(data)
+
+def iter_jobs(patients: Iterable[Patient], cids: Sequence[str]) -> Iterator[Job]:
+    for p in patients:
+        for cid in cids:
+            yield (p.pid, p.nombre, cid)
+
+def make_executor(kind: str, workers: int, guiones_dir: str, out_dir: str, ehr: str = "",
+                  transcript: bool = False) -> Executor:
+    pool = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+    return pool(max_workers=workers, initializer=_init_worker, initargs=(guiones_dir, out_dir, ehr, transcript))
+
+def run_batch(patients: Sequence[Patient], cids: Sequence[str], out_dir: str,
+              workers: int = 0, kind: str = "process", guiones_dir: str = GUIONES_DIR,
+              chunksize: int = 64, progress: bool = True, ehr: str = "",
+              transcript: bool = False) -> Dict[str, float]:
+    os.makedirs(out_dir, exist_ok=True)
+    total = len(patients) * len(cids)
+    workers = workers or os.cpu_count() or 1
+    done = nbytes = 0
+    t0 = time.perf_counter()
+    with make_executor(kind, workers, guiones_dir, out_dir, ehr, transcript) as ex:
+        for size in ex.map(_run_job, iter_jobs(patients, cids), chunksize=chunksize):
+            done += 1
+            nbytes += size
+            if progress and (done % 500 == 0 or done == total):
+                rate = done / max(1e-9, time.perf_counter() - t0)
+                print(f"\r{done}/{total} reportes • {rate:,.0f}/s", end="", file=sys.stderr, flush=True)
+    elapsed = time.perf_counter() - t0
+    if progress and total:
+        print(file=sys.stderr)
+    return dict(reports=done, bytes=nbytes, seconds=elapsed, per_second=done / max(1e-9, elapsed))
+
+def export_zip(patients: Sequence[Patient], cids: Sequence[str], path: str,
+               guiones_dir: str = GUIONES_DIR, ehr: str = "", transcript: bool = False) -> Dict[str, float]:
+    # Un solo archivo: cada reporte se compone y se comprime al vuelo, en este
+    # proceso, así en memoria nunca hay más de uno.
+    _init_worker(guiones_dir, "", ehr, transcript)
+    t0 = time.perf_counter()
+    with open(path, "wb") as fh:
+        done = write_zip(fh, map(_render, iter_jobs(patients, cids)))
+    elapsed = time.perf_counter() - t0
+    return dict(reports=done, bytes=os.path.getsize(path), seconds=elapsed, per_second=done / max(1e-9, elapsed))
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m preconsulta.batch",
+                                 description="Genera los reportes .md de preconsulta sin la UI.")
+    ap.add_argument("--out", default="reportes", help="carpeta de salida (por defecto: reportes/)")
+    ap.add_argument("--zip", default="", help="escribe un solo .zip en vez de la carpeta (sin pool)")
+    ap.add_argument("--patients", help="CSV, JSON o almacén .sqlite3 de pacientes (por defecto: PACIENTES de la demo)")
+    ap.add_argument("--ehr", default="", help="almacén de expedientes para las secciones EHR (ver preconsulta.records)")
+    ap.add_argument("--transcript", action="store_true",
+                    help="agrega la transcripción con horas de un reloj virtual (reproducible)")
+    ap.add_argument("--conditions", help="cids separados por coma (por defecto: todos los guiones)")
+    ap.add_argument("--guiones", default=GUIONES_DIR, help="carpeta de guiones JSON")
+    ap.add_argument("--workers", type=int, default=0, help="tamaño del pool (por defecto: nº de CPUs)")
+    ap.add_argument("--executor", choices=("process", "thread"), default="process")
+    ap.add_argument("--chunksize", type=int, default=64, help="trabajos por envío al pool")
+    ap.add_argument("--quiet", action="store_true", help="sin progreso en stderr")
+    args = ap.parse_args(argv)
+
+    scripts = load_scripts(args.guiones)
+    cids = args.conditions.split(",") if args.conditions else list(scripts)
+    unknown = [c for c in cids if c not in scripts]
+    if unknown:
+        ap.error(f"condiciones desconocidas: {', '.join(unknown)}")
+    patients = load_patients(args.patients) if args.patients else PACIENTES
+
+    if args.zip:
+        stats = export_zip(patients, cids, args.zip, guiones_dir=args.guiones, ehr=args.ehr,
+                           transcript=args.transcript)
+    else:
+        stats = run_batch(patients, cids, args.out, workers=args.workers, kind=args.executor,
+                          guiones_dir=args.guiones, chunksize=args.chunksize, progress=not args.quiet, ehr=args.ehr,
+                          transcript=args.transcript)
+    print(f"{stats['reports']:,} reportes • {stats['bytes'] / 1e6:.2f} MB • "
+          f"{stats['seconds']:.2f} s • {stats['per_second']:,.0f} reportes/s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# Catálogo indexado de pacientes o condiciones: búsqueda O(1) por id,
+# búsqueda por prefijo con bisect sobre los términos ordenados y, si el
+# prefijo no encuentra nada, búsqueda difusa: un índice de trigramas elige
+# unos pocos candidatos del vocabulario y difflib sólo compara esos.
+# Los resultados son posiciones; la vista sólo pagina y pinta una página.
+import difflib
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+FUZZY_CANDIDATES = 64       # términos que difflib compara por token, sin importar el catálogo
+
+def fold(text: str) -> str:
+    # minúsculas y sin acentos: "Sofía" y "sofia" son el mismo término
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def terms(text: str) -> List[str]:
+    return [t for t in "".join(ch if ch.isalnum() else " " for ch in fold(text)).split() if t]
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Catalog(Generic[T]):
+    def __init__(self, items: Iterable[T], key: Callable[[T], str],
+                 text: Callable[[T], str], cache_size: int = 256):
+        self.items: List[T] = list(items)
+        self.by_id: Dict[str, T] = {}
+        pairs: List[Tuple[str, int]] = []
+        for pos, item in enumerate(self.items):
+            ident = key(item)
+            if ident in self.by_id:
+                raise ValueError(f"id duplicado en el catálogo: {ident}")
+            self.by_id[ident] = item
+            for term in set(terms(ident + " " + text(item))):
+                pairs.append((term, pos))
+        pairs.sort()
+        self._terms = [t for t, _ in pairs]
+        self._postings = [p for _, p in pairs]
+        self._vocab = sorted(set(self._terms))
+        self._grams: Dict[str, List[int]] = {}      # trigrama → posiciones en _vocab
+        for i, term in enumerate(self._vocab):
+            for gram in trigrams(term):
+                self._grams.setdefault(gram, []).append(i)
+        self._cache: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()    # compartido entre sesiones
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, ident: object) -> bool:
+        return ident in self.by_id
+
+    def get(self, ident: Optional[str]) -> Optional[T]:
+        return self.by_id.get(ident) if ident is not None else None
+
+    def _prefix(self, prefix: str) -> Set[int]:
+        lo = bisect_left(self._terms, prefix)
+        hi = bisect_left(self._terms, prefix + "\uffff", lo)
+        return set(self._postings[lo:hi])
+
+    def _fuzzy(self, token: str) -> Set[int]:
+        # Candidatos: los términos que más trigramas comparten con el token
+        shared: Counter = Counter()
+        for gram in trigrams(token):
+            shared.update(self._grams.get(gram, ()))
+        candidates = [self._vocab[i] for i, _ in shared.most_common(FUZZY_CANDIDATES)]
+        found: Set[int] = set()
+        for term in difflib.get_close_matches(token, candidates, n=8, cutoff=0.75):
+            found |= self._prefix(term)
+        return found
+
+    def search(self, query: str) -> Tuple[int, ...]:
+        # Todos los tokens deben coincidir (AND); sin consulta, todo el catálogo
+        tokens = terms(query)
+        key = " ".join(tokens)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        if not tokens:
+            hits: Tuple[int, ...] = tuple(range(len(self.items)))
+        else:
+            found: Optional[Set[int]] = None
+            for token in tokens:
+                match = self._prefix(token) or self._fuzzy(token)
+                found = match if found is None else found & match
+                if not found:
+                    break
+            hits = tuple(sorted(found or ()))
+        with self._lock:
+            self._cache[key] = hits
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return hits
+
+    def page(self, hits: Sequence[int], page: int, size: int) -> Tuple[List[T], int, int]:
+        # (ítems de la página, página efectiva, total de páginas)
+        pages = max(1, -(-len(hits) // size))
+        page = max(0, min(page, pages - 1))
+        return [self.items[i] for i in hits[page * size:(page + 1) * size]], page, pages
@@ -0,0 +1,115 @@
+# Checkpoints de sesión sobre un backend de estado (ver state.py). Las
+# escrituras se acumulan en memoria (la última por token gana) y un hilo de
+# fondo las vuelca en lote, así el rerun nunca espera al disco ni a la red.
+# Las lecturas pasan por una caché local con TTL corto: otro proceso pudo
+# haber avanzado la misma sesión.
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .state import StateBackend, open_backend
+
+DEFAULT_PATH = os.path.join(".preconsulta", "sesiones.sqlite3")
+
+class CheckpointStore:
+    def __init__(self, backend: StateBackend, flush_interval: float = 0.5,
+                 cache_ttl: float = 5.0, cache_size: int = 1024):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.writes = 0
+        self.batches = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.last_error = ""
+        self._pending: Dict[str, str] = {}
+        self._inflight = 0             # lotes tomados por el hilo y aún no escritos
+        self._cache: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def open(cls, url: str = DEFAULT_PATH, **kwargs) -> "CheckpointStore":
+        return cls(open_backend(url), **kwargs)
+
+    def save(self, token: str, state: dict):
+        payload = json.dumps(state, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            self._pending[token] = payload
+            self._remember(token, payload)
+
+    def load(self, token: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            payload = self._pending.get(token)
+            hit = self._cache.get(token)
+            if payload is None and hit is not None and now - hit[0] < self.cache_ttl:
+                payload = hit[1]
+                self.hits += 1
+        if payload is None and (hit is None or now - hit[0] >= self.cache_ttl):
+            self.misses += 1
+            payload = self.backend.get(token)
+            with self._lock:
+                self._remember(token, payload)
+        return json.loads(payload) if payload else None
+
+    def _remember(self, token: str, payload: Optional[str]):
+        self._cache[token] = (time.monotonic(), payload)
+        self._cache.move_to_end(token)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def flush(self, timeout: float = 5.0):
+        # Vuelve cuando todo lo guardado llegó al backend: nada pendiente y
+        # ningún lote a medio escribir (uno fallido vuelve a _pending)
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._pending and not self._inflight:
+                    return
+            self._wake.set()
+            time.sleep(0.01)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.backend.close()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight += bool(batch)
+            if batch:
+                try:
+                    self.backend.put_many(batch)
+                except Exception as exc:
+                    # Backend caído: el lote vuelve a la cola sin pisar lo más nuevo
+                    self.errors += 1
+                    self.last_error = repr(exc)
+                    with self._lock:
+                        self._pending = {**batch, **self._pending}
+                        self._inflight -= 1
+                    if self._closed:
+                        break
+                    continue
+                with self._lock:
+                    self._inflight -= 1
+                self.writes += len(batch)
+                self.batches += 1
+            if self._closed:
+                with self._lock:
+                    if not self._pending:
+                        break
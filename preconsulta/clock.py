@@ -0,0 +1,45 @@
+# Reloj inyectable para el ritmo de la entrevista y las horas de los mensajes.
+# RealClock usa el reloj del sistema; VirtualClock sólo avanza cuando se le
+# pide (o cuando algo "duerme" sobre él), así una entrevista completa corre en
+# milisegundos y produce siempre la misma transcripción, con las mismas horas.
+import time
+from datetime import datetime, timedelta
+from typing import Protocol
+
+class Clock(Protocol):
+    def monotonic(self) -> float: ...
+    def now(self) -> datetime: ...
+    def sleep(self, seconds: float) -> None: ...
+
+class RealClock:
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+# Hora de arranque fija del reloj virtual: transcripciones reproducibles
+VIRTUAL_EPOCH = datetime(2024, 1, 15, 9, 0)
+
+class VirtualClock:
+    def __init__(self, start: datetime = VIRTUAL_EPOCH):
+        self.start = start
+        self.t = 0.0
+
+    def monotonic(self) -> float:
+        return self.t
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self.t)
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, dt: float):
+        self.t += max(0.0, dt)
+
+REAL_CLOCK = RealClock()
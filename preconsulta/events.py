@@ -0,0 +1,240 @@
+# Bitácora de eventos de la entrevista (auditoría), sólo de anexado. emit()
+# nunca toca el disco: encola en una cola acotada y un hilo de fondo escribe
+# en lote lo que se haya juntado. Si la cola se llena, emit() espera un
+# momento y luego descarta; las métricas dicen cuánto pasó cada cosa.
+#
+#   ruta.jsonl                      → JSONLSink (una línea por evento)
+#   ruta.sqlite3 / sqlite://ruta    → SQLiteSink (tabla events)
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Protocol, Tuple, Union
+
+from .clock import REAL_CLOCK, Clock
+
+DEFAULT_PATH = os.path.join(".preconsulta", "eventos.jsonl")
+
+Event = Dict[str, object]     # ts, session, kind y los datos del evento
+
+class EventSink(Protocol):
+    def write_many(self, events: List[Event]) -> None: ...
+    def close(self) -> None: ...
+
+def _ensure_folder(path: str):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+class JSONLSink:
+    def __init__(self, path: str):
+        _ensure_folder(path)
+        self.path = path
+        self._fh = open(path, "a", encoding="utf-8")
+
+    def write_many(self, events: List[Event]):
+        self._fh.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events))
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY,
+    ts      TEXT NOT NULL,
+    session TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    data    TEXT NOT NULL
+)
+"""
+
+class SQLiteSink:
+    # Una sola conexión, usada sólo por el hilo escritor
+    def __init__(self, path: str):
+        _ensure_folder(path)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+
+    def write_many(self, events: List[Event]):
+        rows = []
+        for e in events:
+            data = {k: v for k, v in e.items() if k not in ("ts", "session", "kind")}
+            rows.append((e["ts"], e["session"], e["kind"], json.dumps(data, ensure_ascii=False)))
+        with self._conn:
+            self._conn.executemany("INSERT INTO events (ts, session, kind, data) VALUES (?, ?, ?, ?)", rows)
+
+    def close(self):
+        self._conn.close()
+
+def _parse(raw: Union[str, bytes]) -> Optional[Event]:
+    try:
+        event = json.loads(raw)
+    except ValueError:
+        return None
+    return event if isinstance(event, dict) else None
+
+def read_events(url: str, since: int = 0,
+                on_bad: Optional[Callable[[bytes], None]] = None) -> Tuple[List[Event], int]:
+    # Lectura incremental para quien sigue la bitácora (p. ej. el índice de
+    # búsqueda): since es un offset en bytes (.jsonl) o el último id (SQLite).
+    # Devuelve los eventos nuevos y el valor de since para la próxima vez.
+    # Una línea rota (escritor interrumpido, lotes de dos procesos mezclados)
+    # se salta y se informa a on_bad; el offset avanza igual.
+    path = url[len("sqlite://"):] if url.startswith("sqlite://") else url
+    if not os.path.exists(path):
+        return [], since
+    if url.startswith("sqlite://") or url.endswith((".sqlite3", ".db")):
+        conn = sqlite3.connect(path, timeout=10)
+        try:
+            rows = conn.execute("SELECT id, ts, session, kind, data FROM events WHERE id > ? ORDER BY id",
+                                (since,)).fetchall()
+        finally:
+            conn.close()
+        events = []
+        for _, ts, session, kind, data in rows:
+            fields = _parse(data)
+            if fields is None:
+                if on_bad is not None:
+                    on_bad(data.encode("utf-8"))
+                continue
+            events.append(dict(fields, ts=ts, session=session, kind=kind))
+        return events, rows[-1][0] if rows else since
+    with open(path, "rb") as fh:
+        fh.seek(since)
+        chunk = fh.read()
+    end = chunk.rfind(b"\n") + 1             # una línea a medio escribir queda para después
+    events = []
+    for line in chunk[:end].splitlines():
+        if not line.strip():
+            continue
+        event = _parse(line)
+        if event is None:
+            if on_bad is not None:
+                on_bad(line)
+            continue
+        events.append(event)
+    return events, since + end
+
+def open_sink(url: str) -> EventSink:
+    if url.startswith("sqlite://"):
+        return SQLiteSink(url[len("sqlite://"):])
+    if url.endswith((".sqlite3", ".db")):
+        return SQLiteSink(url)
+    return JSONLSink(url)
+
+class EventLog:
+    def __init__(self, sink: EventSink, max_queue: int = 10000, batch_size: int = 512,
+                 put_timeout: float = 0.05, clock: Clock = REAL_CLOCK):
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.clock = clock
+        self.emitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.full = 0              # emit() que encontraron la cola llena
+        self.waited = 0.0          # segundos esperando lugar en la cola
+        self.batches = 0
+        self.max_depth = 0
+        self.errors = 0
+        self.last_error = ""
+        self._queue: "queue.Queue[Optional[Event]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def open(cls, url: str = DEFAULT_PATH, **kwargs) -> "EventLog":
+        return cls(open_sink(url), **kwargs)
+
+    def emit(self, session: str, kind: str, data: Optional[Dict[str, object]] = None,
+             at: Optional[datetime] = None) -> bool:
+        event: Event = dict(ts=(at or self.clock.now()).isoformat(timespec="milliseconds"),
+                            session=session, kind=kind, **(data or {}))
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            t0 = time.monotonic()
+            try:
+                self._queue.put(event, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.full += 1
+                    self.dropped += 1
+                    self.waited += time.monotonic() - t0
+                return False
+            with self._lock:
+                self.full += 1
+                self.waited += time.monotonic() - t0
+        with self._lock:
+            self.emitted += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def emit_many(self, session: str, events: Iterable[Tuple[str, Dict[str, object]]],
+                  at: Optional[datetime] = None) -> int:
+        # Varios eventos con la misma hora (p. ej. los turnos de un salto)
+        at = at or self.clock.now()
+        return sum(self.emit(session, kind, data, at=at) for kind, data in events)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(emitted=self.emitted, written=self.written, dropped=self.dropped,
+                        full=self.full, waited_ms=self.waited * 1000, batches=self.batches,
+                        depth=self._queue.qsize(), max_depth=self.max_depth, errors=self.errors)
+
+    def flush(self, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self.sink.close()
+
+    def _run(self):
+        # Lo que llegó mientras se escribía el lote anterior va en el próximo
+        while True:
+            first = self._queue.get()
+            batch: List[Event] = []
+            closing = first is None
+            if not closing:
+                batch.append(first)
+            while len(batch) < self.batch_size:
+                try:
+                    event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    closing = True
+                    break
+                batch.append(event)
+            while batch:
+                try:
+                    self.sink.write_many(batch)
+                except Exception as exc:
+                    # Disco lleno o bloqueado: se reintenta; la cola hace de freno
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = repr(exc)
+                    if closing:
+                        break
+                    time.sleep(0.5)
+                    continue
+                with self._lock:
+                    self.written += len(batch)
+                    self.batches += 1
+                break
+            for _ in range(len(batch) + int(closing)):
+                self._queue.task_done()
+            if closing:
+                return
@@ -0,0 +1,16 @@
+# Exportación de reportes bajo demanda. Nada se compone en el rerun: la vista
+# pasa callables a st.download_button, y un zip se escribe entrada por
+# entrada desde un iterable perezoso, sin juntar todos los reportes en memoria.
+import zipfile
+from typing import BinaryIO, Iterable, Tuple
+
+Entry = Tuple[str, str]     # (nombre dentro del zip, contenido)
+
+def write_zip(fh: BinaryIO, entries: Iterable[Entry]) -> int:
+    # fh puede no ser seekable (respuesta HTTP, pipe): zipfile usa descriptores
+    n = 0
+    with zipfile.ZipFile(fh, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, text in entries:
+            zf.writestr(name, text.encode("utf-8"))
+            n += 1
+    return n
@@ -0,0 +1,148 @@
+# Extracción de hechos de respuestas libres: un autómata Aho-Corasick por
+# guion, compilado una vez desde su tabla "claves" (sección, hecho, palabras
+# clave), recorre cada respuesta nueva en una sola pasada. El estado del
+# reporte se actualiza sólo con lo nuevo; nunca se re-escanea la conversación.
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .catalog import fold
+from .report import consolidate, seed_facts
+
+Keyword = Tuple[str, str, Tuple[str, ...]]     # (sección, hecho, palabras clave)
+Match = Tuple[int, int, int]                   # (inicio, fin, nº de entrada)
+
+# Una coincidencia se descarta si alguna de estas palabras aparece entre las
+# tres anteriores de la misma cláusula ("no tengo fiebre", "ni vómito").
+NEGATORS = frozenset(("no", "ni", "sin", "niego", "nunca", "tampoco"))
+NEGATION_WINDOW = 3
+CLAUSE_BREAKS = ".;:!?\n"
+
+@lru_cache(maxsize=4096)
+def _fold_char(ch: str) -> str:
+    f = fold(ch)
+    return f if len(f) == 1 else ch.lower()
+
+def fold_chars(text: str) -> str:
+    # Como fold(), pero carácter a carácter: las posiciones coinciden con el
+    # texto original y el hecho puede citar lo que escribió el paciente.
+    return "".join(map(_fold_char, text))
+
+class KeywordMatcher:
+    def __init__(self, entries: Sequence[Keyword]):
+        self.entries = tuple(entries)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int, bool]]] = [[]]   # (largo, entrada, raíz)
+        for n, (_, _, keywords) in enumerate(self.entries):
+            for kw in keywords:
+                stem = kw.endswith("*")
+                self._add(fold_chars(kw.rstrip("*").strip()), n, stem)
+        self._link()
+
+    def _add(self, word: str, entry: int, stem: bool):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(word), entry, stem))
+
+    def _link(self):
+        # BFS: enlaces de fallo y salidas heredadas del sufijo más largo
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, folded: str) -> Iterator[Match]:
+        # Coincidencias con límite de palabra al inicio y, salvo raíces
+        # ("escalofr*"), también al final.
+        state = 0
+        size = len(folded)
+        for i, ch in enumerate(folded):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, entry, stem in self._out[state]:
+                start, end = i + 1 - length, i + 1
+                if start > 0 and folded[start - 1].isalnum():
+                    continue
+                if stem:
+                    while end < size and folded[end].isalnum():
+                        end += 1
+                elif end < size and folded[end].isalnum():
+                    continue
+                yield start, end, entry
+
+def negated(folded: str, start: int) -> bool:
+    clause = folded[:start]
+    cut = max(clause.rfind(c) for c in CLAUSE_BREAKS)
+    words = "".join(ch if ch.isalnum() else " " for ch in clause[cut + 1:]).split()
+    return any(w in NEGATORS for w in words[-NEGATION_WINDOW:])
+
+class LiveFacts:
+    # Estado incremental del reporte en modo libre: feed() escanea sólo la
+    # respuesta nueva; facts() arma el reporte con lo acumulado.
+    def __init__(self, matcher: KeywordMatcher):
+        self.matcher = matcher
+        self.fed = 0
+        self.found: Dict[str, List[str]] = {}
+        self._seen: Set[Tuple[str, str]] = set()
+        self._facts: Optional[Dict[str, List[str]]] = None
+
+    def feed(self, utterance: str) -> List[Tuple[str, str]]:
+        folded = fold_chars(utterance)
+        new: List[Tuple[str, str]] = []
+        # La coincidencia más larga gana: "tos seca" tapa a "tos"
+        taken = -1
+        for start, end, entry in sorted(self.matcher.find(folded), key=lambda m: (m[0], m[0] - m[1])):
+            if start < taken:
+                continue
+            taken = end
+            if negated(folded, start):
+                continue
+            section, fact, _ = self.matcher.entries[entry]
+            text = fact
+            if "{}" in fact:
+                quote = utterance[start:end]
+                text = fact.replace("{}", quote[:1].upper() + quote[1:] if fact.startswith("{}") else quote)
+            if (section, text) in self._seen:
+                continue
+            self._seen.add((section, text))
+            self.found.setdefault(section, []).append(text)
+            new.append((section, text))
+        self.fed += 1
+        if new:
+            self._facts = None
+        return new
+
+    def feed_all(self, utterances: Iterable[str]) -> int:
+        n = 0
+        for u in utterances:
+            n += len(self.feed(u))
+        return n
+
+    def facts(self) -> Dict[str, List[str]]:
+        # Se rearma sólo si la última respuesta aportó algo; sólo lectura
+        if self._facts is None:
+            facts = seed_facts()
+            for section, arr in self.found.items():
+                facts.setdefault(section, []).extend(arr)
+            self._facts = consolidate(facts)
+        return self._facts
+
+def compile_keywords(raw: Iterable[Sequence[object]]) -> Optional[KeywordMatcher]:
+    entries = [(str(sec), str(fact), tuple(str(k) for k in kws)) for sec, fact, kws in raw]
+    return KeywordMatcher(entries) if entries else None
@@ -0,0 +1,61 @@
+# Modelo de datos del agente de preconsulta (sin dependencias de UI).
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .matcher import KeywordMatcher
+    from .report import FactIndex
+
+Turn = Tuple[str, str]         # ("agent"|"patient", "texto")
+Rule = Tuple[int, str, str]    # (idx_turno_alcanzado, "Sección", "Hecho")
+
+SECTION_ORDER = [
+    "Motivo principal",
+    "HPI",
+    "Antecedentes (EHR)",
+    "Medicaciones (EHR)",
+    "Medicaciones (entrevista)",
+    "Signos autonómicos",
+    "Signos oculares",
+    "Historia dirigida",
+    "Antecedentes familiares",
+    "Factores de riesgo",
+    "Limitación funcional",
+    "Hechos útiles",
+]
+
+@dataclass
+class Patient:
+    pid: str
+    nombre: str
+    edad: int
+    sexo: str
+    condicion_base: str
+
+@dataclass(frozen=True)
+class Condition:
+    cid: str
+    titulo: str
+    descripcion: str
+
+@dataclass(frozen=True)
+class Script:
+    condition: Condition
+    chat: Tuple[Turn, ...]
+    rules: Tuple[Rule, ...]
+    faltantes: Tuple[str, ...]
+    index: "FactIndex" = field(compare=False, repr=False)
+    # Estado del reporte precalculado por turno: snapshots[i + 1] es el estado
+    # con chat_idx == i (el primero, sin turnos). Compartido: sólo lectura.
+    snapshots: Tuple[Dict[str, List[str]], ...] = field(compare=False, repr=False, default=())
+    # Autómata de palabras clave para el modo de respuestas libres (opcional)
+    matcher: Optional["KeywordMatcher"] = field(compare=False, repr=False, default=None)
+
+    def facts_at(self, idx: int) -> Dict[str, List[str]]:
+        return self.snapshots[max(-1, min(idx, len(self.chat) - 1)) + 1]
+
+PACIENTES: List[Patient] = [
+    Patient("nvelarde", "Nicolás Velarde", 34, "Masculino", "Trastorno de ansiedad"),
+    Patient("aduarte",   "Amalia Duarte",   62, "Femenino",  "Diabetes tipo 2"),
+    Patient("szamora",   "Sofía Zamora",    23, "Femenino",  "Asma"),
+]
@@ -0,0 +1,81 @@
+# Ritmo de la entrevista: cuadros de tipeo acotados y agenda de turnos.
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from .clock import REAL_CLOCK, Clock
+from .models import Turn
+
+TYPING_FPS = 12            # tope de cuadros por segundo
+TYPING_MAX_FRAMES = 24     # tope de cuadros por mensaje, sin importar su largo
+
+def typing_frames(text: str, speed: float, fps: float = TYPING_FPS,
+                  max_frames: int = TYPING_MAX_FRAMES) -> List[Tuple[str, float]]:
+    # Prefijos cortados por palabra + pausa por cuadro. La duración total
+    # respeta `speed` (s/char); el número de cuadros queda acotado.
+    if not text:
+        return [("", 0.0)]
+    duration = len(text) * max(0.001, speed)
+    n = max(1, min(max_frames, int(duration * fps)))
+    cuts: List[int] = []
+    for k in range(1, n + 1):
+        pos = (len(text) * k) // n
+        nxt = text.find(" ", pos)
+        pos = len(text) if (nxt == -1 or k == n) else nxt
+        if not cuts or pos > cuts[-1]:
+            cuts.append(pos)
+    delay = duration / len(cuts)
+    return [(text[:pos], delay) for pos in cuts]
+
+class TurnScheduler:
+    # Agenda del próximo turno de una sesión: cuándo empieza a tipearse, qué
+    # cuadro toca en cada tick y cuándo se emite. Nunca duerme; el fragmento
+    # de la entrevista la consulta en cada tick.
+    def __init__(self, clock: Clock = REAL_CLOCK):
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        self.turn: Optional[int] = None
+        self.start_at = 0.0
+        self.due_at = 0.0
+        self.frames: List[Tuple[str, float]] = []   # (prefijo, t desde start_at)
+
+    def arm(self, idx: int, text: str, speed: float, delay: float, animate: bool):
+        self.turn = idx
+        self.start_at = self.clock.monotonic() + max(0.0, delay)
+        frames = typing_frames(text, speed) if animate else [(text, 0.0)]
+        t, self.frames = 0.0, []
+        for chunk, pause in frames:
+            self.frames.append((chunk, t))
+            t += pause
+        self.due_at = self.start_at + t
+
+    def is_due(self) -> bool:
+        return self.turn is not None and self.clock.monotonic() >= self.due_at
+
+    def frame(self) -> Optional[str]:
+        # None mientras el paciente "piensa"; luego el prefijo vigente
+        elapsed = self.clock.monotonic() - self.start_at
+        if elapsed < 0:
+            return None
+        shown = self.frames[0][0]
+        for chunk, t in self.frames:
+            if t > elapsed:
+                break
+            shown = chunk
+        return shown
+
+def replay(chat: Sequence[Turn], clock: Clock, agent_speed: float = 0.018,
+           patient_speed: float = 0.022, thinking_delay: float = 1.0,
+           animate: bool = True) -> List[Tuple[datetime, str, str]]:
+    # Entrevista completa sin UI, con la misma agenda que la vista: cada turno
+    # se emite al vencer su tipeo. Con VirtualClock no espera nada.
+    sched = TurnScheduler(clock)
+    out: List[Tuple[datetime, str, str]] = []
+    for i, (role, text) in enumerate(chat):
+        speed = agent_speed if role == "agent" else patient_speed
+        delay = thinking_delay if role == "patient" else 0.0
+        sched.arm(i, text, speed, delay, animate)
+        clock.sleep(sched.due_at - clock.monotonic())
+        out.append((clock.now(), role, text))
+    return out
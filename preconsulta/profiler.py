@@ -0,0 +1,121 @@
+# Perfilado por rerun: spans con nombre, desglose del último rerun y
+# exportación opcional a JSONL o a Chrome trace (chrome://tracing, Perfetto).
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+Span = Dict[str, object]    # run, label, name, depth, start_ms, dur_ms, ts_us
+
+# Los spans sólo se exportan aquí: el nombre del archivo llega desde el navegador
+SPANS_DIR = os.path.join(".preconsulta", "spans")
+
+def spans_path(name: str) -> str:
+    # Un nombre de archivo .json o .jsonl, sin carpetas ni "..", dentro de SPANS_DIR
+    name = name.strip()
+    if (not name.endswith((".json", ".jsonl")) or name.startswith(".")
+            or "/" in name or "\\" in name or os.path.basename(name) != name):
+        raise ValueError(f"Nombre de archivo inválido: {name!r} (p. ej. spans.jsonl o trace.json)")
+    return os.path.join(SPANS_DIR, name)
+
+class Profiler:
+    # Un perfilador por sesión. Deshabilitado, span() devuelve un contexto
+    # nulo y el costo es despreciable.
+    def __init__(self, enabled: bool = False, sink: str = "", keep: int = 50):
+        self.enabled = enabled
+        self.sink = sink
+        self.runs: Deque[Tuple[str, List[Span]]] = deque(maxlen=keep)
+        self._spans: Optional[List[Span]] = None
+        self._label = ""
+        self._seq = 0
+        self._t0 = 0
+        self._depth = 0
+
+    def begin(self, label: str):
+        # Un rerun interrumpido (st.rerun) se cierra al empezar el siguiente
+        if self._spans is not None:
+            self.end(interrupted=True)
+        if not self.enabled:
+            return
+        self._seq += 1
+        self._label = label
+        self._spans = []
+        self._t0 = time.perf_counter_ns()
+        self._depth = 0
+
+    def end(self, interrupted: bool = False):
+        spans, self._spans = self._spans, None
+        if spans is None:
+            return
+        label = self._label + (" (interrumpido)" if interrupted else "")
+        total = (time.perf_counter_ns() - self._t0) / 1e6
+        spans.append(self._record("rerun", -1, self._t0, total))
+        self.runs.append((label, spans))
+        if self.sink:
+            append_spans(self.sink, spans)
+
+    @contextmanager
+    def run(self, label: str) -> Iterator[None]:
+        # Para reruns parciales (fragmentos): sólo abre un rerun si no hay uno
+        owns = self.enabled and self._spans is None
+        if owns:
+            self.begin(label)
+        try:
+            yield
+        finally:
+            if owns:
+                self.end()
+
+    def span(self, name: str):
+        if self._spans is None:
+            return nullcontext()
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter_ns()
+        depth = self._depth
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth = depth
+            if self._spans is not None:
+                self._spans.append(self._record(name, depth, start, (time.perf_counter_ns() - start) / 1e6))
+
+    def _record(self, name: str, depth: int, start_ns: int, dur_ms: float) -> Span:
+        return dict(
+            run=self._seq, label=self._label, name=name, depth=depth,
+            start_ms=round((start_ns - self._t0) / 1e6, 3), dur_ms=round(dur_ms, 3),
+            ts_us=int(time.time() * 1e6 - (time.perf_counter_ns() - start_ns) / 1e3),
+        )
+
+    def last(self) -> Tuple[str, List[Span]]:
+        return self.runs[-1] if self.runs else ("", [])
+
+def append_spans(path: str, spans: List[Span]):
+    # .json → formato de arreglo de Chrome trace (el "]" final es opcional,
+    # así que se puede seguir anexando); cualquier otra extensión → JSONL.
+    chrome = path.endswith(".json")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", encoding="utf-8") as fh:
+        if chrome and fresh:
+            fh.write("[\n")
+        for s in spans:
+            if chrome:
+                event = dict(name=s["name"], cat=s["label"], ph="X", ts=s["ts_us"],
+                             dur=int(float(s["dur_ms"]) * 1000), pid=os.getpid(), tid=s["run"])
+                fh.write(json.dumps(event, ensure_ascii=False) + ",\n")
+            else:
+                fh.write(json.dumps(s, ensure_ascii=False) + "\n")
+
+def breakdown(spans: List[Span]) -> List[Tuple[str, float]]:
+    # (nombre con sangría por profundidad, ms) en orden de inicio; "rerun" al final
+    rows = sorted((s for s in spans if s["name"] != "rerun"), key=lambda s: s["start_ms"])
+    out = [("  " * int(s["depth"]) + str(s["name"]), float(s["dur_ms"])) for s in rows]
+    out += [("rerun", float(s["dur_ms"])) for s in spans if s["name"] == "rerun"]
+    return out
@@ -0,0 +1,303 @@
+# Expediente por paciente (antecedentes y medicaciones) en SQLite, importado
+# en bloques desde CSV (pandas) o FHIR (NDJSON de Bulk Data o un Bundle, este
+# último leído con ijson si está instalado). La memoria del import depende del
+# tamaño del bloque, no del archivo.
+#
+#   python -m preconsulta.records expediente.csv --db .preconsulta/ehr.sqlite3
+#   python -m preconsulta.records export/*.ndjson --chunksize 20000
+#
+# CSV en formato largo, una fila por hecho:
+#   pid,tipo,texto[,nombre,edad,sexo,condicion_base]
+#   tipo: antecedente | medicacion (las columnas del paciente son opcionales)
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .catalog import fold
+from .models import Patient
+
+DEFAULT_DB = os.path.join(".preconsulta", "ehr.sqlite3")
+
+HISTORY, MEDICATION = 0, 1
+SECTIONS = {HISTORY: "Antecedentes (EHR)", MEDICATION: "Medicaciones (EHR)"}
+KINDS = {
+    "antecedente": HISTORY, "antecedentes": HISTORY, "historia": HISTORY, "history": HISTORY,
+    "medicacion": MEDICATION, "medicaciones": MEDICATION, "medication": MEDICATION,
+}
+EMPTY_SECTION = ["Sin registro en el expediente"]
+
+# Textos deduplicados en su propia tabla; los hechos agrupados por pid
+# (WITHOUT ROWID) para que un paciente sea un solo rango del árbol.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    pid            TEXT PRIMARY KEY,
+    nombre         TEXT NOT NULL,
+    edad           INTEGER NOT NULL DEFAULT 0,
+    sexo           TEXT NOT NULL DEFAULT '',
+    condicion_base TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS texts (
+    id   INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS facts (
+    pid  TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    text INTEGER NOT NULL REFERENCES texts(id),
+    seq  INTEGER NOT NULL,
+    PRIMARY KEY (pid, kind, text)
+) WITHOUT ROWID;
+"""
+
+FactRow = Tuple[str, int, str]                       # (pid, kind, texto)
+PatientRow = Tuple[str, str, int, str, str]
+
+class RecordStore:
+    def __init__(self, path: str = DEFAULT_DB, cache_size: int = 4096):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Optional[Dict[str, List[str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_seq: Optional[int] = None     # se lee una vez, en la primera escritura
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def ehr(self, pid: str) -> Optional[Dict[str, List[str]]]:
+        # Secciones EHR del paciente, o None si no hay nada importado para él
+        with self._lock:
+            if pid in self._cache:
+                self._cache.move_to_end(pid)
+                return self._cache[pid]
+        rows = self._conn().execute(
+            "SELECT f.kind, t.text FROM facts f JOIN texts t ON t.id = f.text "
+            "WHERE f.pid = ? ORDER BY f.kind, f.seq", (pid,)).fetchall()
+        found: Optional[Dict[str, List[str]]] = None
+        if rows or self.patient(pid) is not None:
+            found = {name: [] for name in SECTIONS.values()}
+            for kind, text in rows:
+                found[SECTIONS[kind]].append(text)
+            for name, arr in found.items():
+                if not arr:
+                    found[name] = list(EMPTY_SECTION)
+        with self._lock:
+            self._cache[pid] = found
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return found
+
+    def patient(self, pid: str) -> Optional[Patient]:
+        row = self._conn().execute(
+            "SELECT pid, nombre, edad, sexo, condicion_base FROM patients WHERE pid = ?", (pid,)).fetchone()
+        return Patient(*row) if row else None
+
+    def patients(self) -> Iterator[Patient]:
+        for row in self._conn().execute("SELECT pid, nombre, edad, sexo, condicion_base FROM patients ORDER BY pid"):
+            yield Patient(*row)
+
+    def counts(self) -> Dict[str, int]:
+        conn = self._conn()
+        return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("patients", "facts", "texts")}
+
+    def write_chunk(self, patients: Sequence[PatientRow], facts: Sequence[FactRow]):
+        # Un bloque, una transacción. Re-importar el mismo hecho no lo duplica.
+        conn = self._conn()
+        with conn:
+            if patients:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO patients (pid, nombre, edad, sexo, condicion_base) VALUES (?, ?, ?, ?, ?)",
+                    patients)
+            if facts:
+                # MAX(seq) recorre toda la tabla: sólo se consulta una vez por store
+                if self._next_seq is None:
+                    self._next_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM facts").fetchone()[0] + 1
+                seq0 = self._next_seq
+                conn.executemany("INSERT OR IGNORE INTO texts (text) VALUES (?)", {(t,) for _, _, t in facts})
+                conn.executemany(
+                    "INSERT OR IGNORE INTO facts (pid, kind, text, seq) "
+                    "SELECT ?, ?, id, ? FROM texts WHERE text = ?",
+                    [(pid, kind, seq0 + i, text) for i, (pid, kind, text) in enumerate(facts)])
+        if facts:
+            self._next_seq = seq0 + len(facts)      # sólo si la transacción se confirmó
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# -----------------------------------------------------------------------------
+# Lectores por bloques: cada uno produce (pacientes, hechos) por bloque
+# -----------------------------------------------------------------------------
+def _csv_chunks(path: str, chunksize: int) -> Iterator[Tuple[List[PatientRow], List[FactRow]]]:
+    import pandas as pd
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+        chunk.columns = [c.strip().lower() for c in chunk.columns]
+        chunk["pid"] = chunk["pid"].str.strip()
+        chunk = chunk[chunk["pid"] != ""]
+        patients: List[PatientRow] = []
+        if "nombre" in chunk.columns:
+            people = chunk[chunk["nombre"].str.strip() != ""].drop_duplicates("pid", keep="last")
+            edad = pd.to_numeric(people.get("edad", pd.Series(index=people.index, dtype=str)), errors="coerce")
+            blank = pd.Series("", index=people.index)
+            patients = list(zip(
+                people["pid"].tolist(), people["nombre"].str.strip().tolist(), edad.fillna(0).astype(int).tolist(),
+                people.get("sexo", blank).tolist(), people.get("condicion_base", blank).tolist(),
+            ))
+        facts: List[FactRow] = []
+        if "tipo" in chunk.columns and "texto" in chunk.columns:
+            kind = chunk["tipo"].map(lambda t: KINDS.get(fold(t.strip())))
+            keep = kind.notna() & (chunk["texto"].str.strip() != "")
+            facts = list(zip(chunk["pid"][keep].tolist(), kind[keep].astype(int).tolist(),
+                             chunk["texto"][keep].str.strip().tolist()))
+        yield patients, facts
+
+def _dict(value: object) -> dict:
+    return value if isinstance(value, dict) else {}
+
+def _first(value: object) -> dict:
+    return _dict(value[0]) if isinstance(value, list) and value else {}
+
+def _str(value: object) -> str:
+    return value if isinstance(value, str) else ""
+
+def _ref_pid(ref: object) -> str:
+    # "Patient/123" o "urn:uuid:123" → "123"
+    ref = _str(_dict(ref).get("reference"))
+    return ref.rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+
+def _concept_text(concept: object) -> str:
+    concept = _dict(concept)
+    if _str(concept.get("text")):
+        return concept["text"]
+    for coding in concept.get("coding") or []:
+        if _str(_dict(coding).get("display")):
+            return coding["display"]
+    return ""
+
+def _years(birth: object) -> int:
+    try:
+        born = date.fromisoformat(str(birth)[:10])
+    except ValueError:
+        return 0
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+def _fhir_rows(resources: Iterable[dict]) -> Tuple[List[PatientRow], List[FactRow]]:
+    # Cualquier campo opcional puede faltar, venir en null o con otro tipo
+    patients: List[PatientRow] = []
+    facts: List[FactRow] = []
+    for r in resources:
+        r = _dict(r)
+        kind = r.get("resourceType")
+        if kind == "Patient":
+            pid = str(r.get("id") or "")
+            name = _first(r.get("name"))
+            given = [g for g in name.get("given") or [] if isinstance(g, str)]
+            nombre = _str(name.get("text")) or " ".join([*given, _str(name.get("family"))]).strip()
+            gender = _str(r.get("gender"))
+            sexo = {"male": "Masculino", "female": "Femenino"}.get(gender, gender)
+            patients.append((pid, nombre or pid, _years(r.get("birthDate")), sexo, ""))
+        elif kind == "Condition":
+            text = _concept_text(r.get("code"))
+            if text:
+                facts.append((_ref_pid(r.get("subject")), HISTORY, text))
+        elif kind in ("MedicationStatement", "MedicationRequest"):
+            text = _concept_text(r.get("medicationCodeableConcept")) or _concept_text(
+                _dict(r.get("medication")).get("concept"))
+            if text:
+                facts.append((_ref_pid(r.get("subject")), MEDICATION, text))
+    return [p for p in patients if p[0]], [f for f in facts if f[0]]
+
+# Sin ijson un Bundle se carga entero: sólo se acepta si es chico
+BUNDLE_MAX_BYTES = 64 * 1024 * 1024
+
+def _bundle_resources(path: str) -> Iterator[dict]:
+    # Bundle: un solo documento JSON; con ijson las entradas se leen de a una
+    try:
+        import ijson
+    except ImportError:
+        size = os.path.getsize(path)
+        if size > BUNDLE_MAX_BYTES:
+            raise RuntimeError(
+                f"{path}: Bundle de {size / 2**20:.0f} MB; leerlo en memoria acotada requiere "
+                "el paquete 'ijson' (pip install ijson) o convertirlo a NDJSON") from None
+        with open(path, encoding="utf-8") as fh:
+            bundle = json.load(fh)
+        for entry in _dict(bundle).get("entry") or []:
+            yield _dict(entry).get("resource")
+        return
+    with open(path, "rb") as fh:
+        yield from ijson.items(fh, "entry.item.resource", use_float=True)
+
+def _ndjson_resources(path: str) -> Iterator[dict]:
+    # FHIR Bulk Data: un recurso por línea
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+def _fhir_chunks(path: str, chunksize: int) -> Iterator[Tuple[List[PatientRow], List[FactRow]]]:
+    ndjson = path.endswith(".ndjson") or path.endswith(".jsonl")
+    resources = _ndjson_resources(path) if ndjson else _bundle_resources(path)
+    while True:
+        block = list(islice(resources, chunksize))
+        if not block:
+            return
+        yield _fhir_rows(block)
+
+def import_records(store: RecordStore, path: str, chunksize: int = 50000,
+                   progress: bool = False) -> Dict[str, float]:
+    reader = _csv_chunks if path.endswith(".csv") else _fhir_chunks
+    n_patients = n_facts = 0
+    t0 = time.perf_counter()
+    for patients, facts in reader(path, chunksize):
+        store.write_chunk(patients, facts)
+        n_patients += len(patients)
+        n_facts += len(facts)
+        if progress:
+            print(f"\r{os.path.basename(path)}: {n_patients:,} pacientes • {n_facts:,} hechos",
+                  end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+    return dict(patients=n_patients, facts=n_facts, seconds=time.perf_counter() - t0)
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m preconsulta.records",
+                                 description="Importa expedientes (CSV o FHIR) al almacén por paciente.")
+    ap.add_argument("files", nargs="+", help="CSV, FHIR NDJSON (.ndjson) o FHIR Bundle (.json)")
+    ap.add_argument("--db", default=DEFAULT_DB, help=f"almacén SQLite (por defecto: {DEFAULT_DB})")
+    ap.add_argument("--chunksize", type=int, default=50000, help="filas o recursos por bloque")
+    ap.add_argument("--quiet", action="store_true", help="sin progreso en stderr")
+    args = ap.parse_args(argv)
+
+    store = RecordStore(args.db)
+    for path in args.files:
+        stats = import_records(store, path, args.chunksize, progress=not args.quiet)
+        print(f"{path}: {stats['patients']:,} pacientes • {stats['facts']:,} hechos • {stats['seconds']:.2f} s")
+    counts = store.counts()
+    print(f"{args.db}: {counts['patients']:,} pacientes • {counts['facts']:,} hechos • {counts['texts']:,} textos únicos")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
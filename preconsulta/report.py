@@ -0,0 +1,99 @@
+# Construcción del reporte a partir de reglas
+import json
+from bisect import bisect_right
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+
+from .models import SECTION_ORDER, Rule
+
+EHR_SEED = {
+    "Antecedentes (EHR)": ["Antecedente crónico declarado en ficha del paciente"],
+    "Medicaciones (EHR)": ["Medicación habitual según expediente (si aplica)"],
+}
+
+UTILES_SOURCES = ("Signos autonómicos","Signos oculares","Historia dirigida","Factores de riesgo","Limitación funcional")
+
+class Records(Protocol):
+    # Lo que el reporte necesita de un expediente (ver records.RecordStore)
+    def ehr(self, pid: str) -> Optional[Dict[str, List[str]]]: ...
+
+def ehr_for(pid: Optional[str] = None, records: Optional[Records] = None) -> Dict[str, List[str]]:
+    # Secciones EHR del paciente; sin expediente importado, el texto genérico
+    found = records.ehr(pid) if records is not None and pid is not None else None
+    return found if found is not None else EHR_SEED
+
+def seed_facts(pid: Optional[str] = None, records: Optional[Records] = None) -> Dict[str, List[str]]:
+    facts: Dict[str, List[str]] = {k: [] for k in SECTION_ORDER}
+    for k, arr in ehr_for(pid, records).items():
+        if k in facts:
+            facts[k] = arr.copy()
+    return facts
+
+def with_ehr(facts: Dict[str, List[str]], pid: Optional[str], records: Optional[Records]) -> Dict[str, List[str]]:
+    # Los snapshots por turno se siembran con EHR_SEED y se comparten entre
+    # pacientes; aquí se reemplazan sólo las secciones EHR, sin copiar el resto.
+    ehr = ehr_for(pid, records)
+    if ehr is EHR_SEED:
+        return facts
+    return {**facts, **{k: list(v) for k, v in ehr.items()}}
+
+class FactIndex:
+    # Reglas de un guion compiladas una vez: por sección, turnos ordenados y
+    # hechos en el mismo orden, así el estado del reporte para cualquier
+    # turno sale con un bisect por sección en lugar de recorrer las reglas.
+    def __init__(self, rules: Sequence[Rule]):
+        by_section: Dict[str, List[Tuple[int, str]]] = {}
+        for i_lim, section, text in sorted(rules, key=lambda r: r[0]):
+            by_section.setdefault(section, []).append((i_lim, text))
+        self.turns = {sec: [t for t, _ in arr] for sec, arr in by_section.items()}
+        self.texts = {sec: tuple(x for _, x in arr) for sec, arr in by_section.items()}
+
+    def at(self, idx_limit: int) -> Dict[str, List[str]]:
+        facts = seed_facts()
+        for sec, turns in self.turns.items():
+            n = bisect_right(turns, idx_limit)
+            if n:
+                facts.setdefault(sec, []).extend(self.texts[sec][:n])
+        return consolidate(facts)
+
+def consolidate(facts: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    # Consolidar "Hechos útiles" desde secciones orientadas a datos puntuales
+    utiles = []
+    for sec in UTILES_SOURCES:
+        utiles += facts.get(sec, [])
+    if utiles:
+        facts["Hechos útiles"] = utiles
+    return facts
+
+def compose_markdown(facts: Dict[str, List[str]], p_name: str, c_title: str) -> str:
+    out: List[str] = []
+    out.append("# Reporte de Preconsulta\n")
+    out.append(f"**Paciente:** {p_name}  \n**Condición:** {c_title}\n")
+    motivo = facts["Motivo principal"][0] if facts["Motivo principal"] else "—"
+    out.append(f"**Motivo principal:** {motivo}\n")
+    def section_md(name: str):
+        arr = facts.get(name, [])
+        if not arr: return [f"- —"]
+        return [f"- {x}" for x in arr]
+    out.append("## Historia de la enfermedad actual (HPI)")
+    out += section_md("HPI")
+    out.append("\n## Antecedentes (EHR)")
+    out += section_md("Antecedentes (EHR)")
+    out.append("\n## Medicaciones")
+    meds = []
+    for m in facts.get("Medicaciones (EHR)", []): meds.append(f"- {m}")
+    for m in facts.get("Medicaciones (entrevista)", []): meds.append(f"- **{m}**")
+    out += meds if meds else ["- —"]
+    utiles = facts.get("Hechos útiles", [])
+    if utiles:
+        out.append("\n## Hechos útiles")
+        out += [f"- {x}" for x in utiles]
+    return "\n".join(out)
+
+def compose_json(facts: Dict[str, List[str]], p_name: str, c_title: str,
+                 pid: Optional[str] = None, cid: Optional[str] = None) -> str:
+    # Mismas secciones que el reporte, en el orden de SECTION_ORDER (vacías incluidas)
+    sections = {k: list(facts.get(k, [])) for k in SECTION_ORDER}
+    sections.update({k: list(v) for k, v in facts.items() if k not in sections})
+    doc = dict(paciente=dict(pid=pid, nombre=p_name), condicion=dict(cid=cid, titulo=c_title),
+               secciones=sections)
+    return json.dumps(doc, ensure_ascii=False, indent=2)
@@ -0,0 +1,105 @@
+# Guiones de entrevista: un JSON por condición en guiones/, validado y
+# compilado una sola vez a objetos inmutables compartidos entre sesiones.
+import json
+import os
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from .matcher import compile_keywords
+from .models import SECTION_ORDER, Condition, Rule, Script, Turn
+from .report import FactIndex
+
+GUIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guiones")
+
+T = TypeVar("T")
+
+class ScriptError(ValueError):
+    pass
+
+def _fields(entry: object, n: int) -> list:
+    if not isinstance(entry, list) or len(entry) != n:
+        raise ValueError(f"se esperaba una lista de {n} elementos y llegó {entry!r}")
+    return entry
+
+def _turn(entry: object) -> Turn:
+    role, txt = _fields(entry, 2)
+    return str(role), str(txt)
+
+def _rule(entry: object) -> Rule:
+    i, sec, txt = _fields(entry, 3)
+    if isinstance(i, bool) or not isinstance(i, int):
+        raise ValueError(f"el turno debe ser un entero y llegó {i!r}")
+    return i, str(sec), str(txt)
+
+def compile_script(raw: dict, source: str) -> Script:
+    def fail(msg: str, cause: Optional[Exception] = None):
+        raise ScriptError(f"{source}: {msg}") from cause
+
+    def entries(key: str, what: str, parse: Callable[[object], T]) -> Tuple[T, ...]:
+        # Una entrada mal formada se informa con su índice, nunca como TypeError suelto
+        if not isinstance(raw[key], list):
+            fail(f"'{key}' debe ser una lista")
+        out = []
+        for n, entry in enumerate(raw[key]):
+            try:
+                out.append(parse(entry))
+            except (TypeError, ValueError, KeyError, IndexError) as exc:
+                fail(f"{what} {n}: {exc}", exc)
+        return tuple(out)
+
+    if not isinstance(raw, dict):
+        fail("se esperaba un objeto JSON")
+    for key in ("cid", "titulo", "descripcion", "chat", "rules", "faltantes"):
+        if key not in raw:
+            fail(f"falta la clave '{key}'")
+    chat = entries("chat", "turno", _turn)
+    if not chat:
+        fail("el guion no tiene turnos")
+    for i, (role, _) in enumerate(chat):
+        expected = "agent" if i % 2 == 0 else "patient"
+        if role != expected:
+            fail(f"turno {i}: se esperaba '{expected}' y llegó '{role}' (los roles deben alternar)")
+    rules = entries("rules", "regla", _rule)
+    for i, sec, _ in rules:
+        if not 0 <= i < len(chat):
+            fail(f"regla con turno {i} fuera de rango (0-{len(chat) - 1})")
+        if sec not in SECTION_ORDER:
+            fail(f"regla con sección desconocida '{sec}'")
+    faltantes = entries("faltantes", "faltante", str)
+    # "claves" (opcional): [sección, hecho, [palabras clave]] para el modo libre;
+    # "{}" en el hecho se reemplaza por lo que escribió el paciente.
+    claves = raw.get("claves", [])
+    if not isinstance(claves, list):
+        fail("'claves' debe ser una lista")
+    for n, entry in enumerate(claves):
+        if not isinstance(entry, list) or len(entry) != 3 or not isinstance(entry[2], list) or not entry[2]:
+            fail(f"clave {n}: se esperaba [sección, hecho, [palabras clave]]")
+        if entry[0] not in SECTION_ORDER:
+            fail(f"clave {n}: sección desconocida '{entry[0]}'")
+        if any(not str(k).rstrip("*").strip() for k in entry[2]):
+            fail(f"clave {n}: palabra clave vacía")
+    index = FactIndex(rules)
+    return Script(
+        condition=Condition(str(raw["cid"]), str(raw["titulo"]), str(raw["descripcion"])),
+        chat=chat,
+        rules=rules,
+        faltantes=faltantes,
+        index=index,
+        snapshots=tuple(index.at(i) for i in range(-1, len(chat))),
+        matcher=compile_keywords(claves),
+    )
+
+def load_scripts(folder: str = GUIONES_DIR) -> Dict[str, Script]:
+    scripts: Dict[str, Script] = {}
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(folder, name), encoding="utf-8") as fh:
+            try:
+                raw = json.load(fh)
+            except json.JSONDecodeError as exc:
+                raise ScriptError(f"{name}: JSON inválido ({exc})") from exc
+        sc = compile_script(raw, name)
+        if sc.condition.cid in scripts:
+            raise ScriptError(f"{name}: condición duplicada '{sc.condition.cid}'")
+        scripts[sc.condition.cid] = sc
+    return scripts
@@ -0,0 +1,136 @@
+# Búsqueda de texto completo sobre las entrevistas registradas. Índice
+# invertido incremental con posiciones: cada turno (o hecho) se indexa una
+# sola vez, al emitirse o al leerse de la bitácora (events.py), y una
+# consulta sólo toca las listas de sus términos, nunca las transcripciones.
+#
+# Consulta: palabras sueltas (todas deben aparecer en el mismo turno),
+# frases entre comillas ("aura visual", términos contiguos) y prefijos con
+# * (dextrometorf*). Sin acentos ni mayúsculas, como el catálogo.
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from .catalog import terms
+from .events import read_events
+
+class Hit(NamedTuple):
+    session: str
+    pid: str
+    cid: str
+    idx: int           # turno de la entrevista
+    kind: str          # turn / fact / answer
+    text: str
+
+Resolve = Callable[[str, int], Optional[str]]     # (cid, turno) → texto del guion
+
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+class TranscriptIndex:
+    def __init__(self, resolve: Optional[Resolve] = None):
+        # resolve: texto de un turno registrado sin texto (bitácoras viejas)
+        self.resolve = resolve
+        self.docs: List[Hit] = []
+        self._postings: Dict[str, Dict[int, List[int]]] = {}
+        self._vocab: List[str] = []
+        self._seen: Set[Hit] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, session: str, pid: str, cid: str, idx: int, kind: str, text: str) -> bool:
+        # Idempotente: el mismo turno puede llegar en vivo y desde la bitácora
+        hit = Hit(session, pid, cid, idx, kind, text)
+        with self._lock:
+            if hit in self._seen:
+                return False
+            self._seen.add(hit)
+            doc = len(self.docs)
+            self.docs.append(hit)
+            for pos, term in enumerate(terms(text)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    insort(self._vocab, term)
+                postings.setdefault(doc, []).append(pos)
+        return True
+
+    def add_event(self, event: Dict[str, object]) -> bool:
+        kind = event.get("kind")
+        if kind not in ("turn", "fact", "answer"):
+            return False
+        cid, idx = str(event.get("cid", "")), int(event.get("idx", -1))
+        text = event.get("text")
+        if text is None and kind == "turn" and self.resolve is not None:
+            text = self.resolve(cid, idx)
+        return bool(text) and self.add(str(event.get("session", "")), str(event.get("pid", "")),
+                                       cid, idx, str(kind), str(text))
+
+    def add_events(self, events: Iterable[Dict[str, object]]) -> int:
+        return sum(self.add_event(e) for e in events)
+
+    def _expand(self, token: str) -> Dict[int, List[int]]:
+        # "dextrometorf*" → unión de las listas de todos los términos con ese prefijo
+        if not token.endswith("*"):
+            return self._postings.get(token, {})
+        prefix = token.rstrip("*")
+        merged: Dict[int, List[int]] = {}
+        for term in self._vocab[bisect_left(self._vocab, prefix):bisect_left(self._vocab, prefix + "\uffff")]:
+            for doc, positions in self._postings[term].items():
+                merged.setdefault(doc, []).extend(positions)
+        return merged
+
+    def search(self, query: str, limit: int = 200) -> List[Hit]:
+        with self._lock:
+            phrases: List[List[Dict[int, List[int]]]] = []
+            for quoted, bare in _QUERY_RE.findall(query):
+                if quoted:
+                    tokens = terms(quoted)
+                    if tokens:
+                        phrases.append([self._expand(t) for t in tokens])
+                    continue
+                tokens = terms(bare)
+                if tokens and bare.endswith("*"):
+                    tokens[-1] += "*"
+                phrases.extend([self._expand(t)] for t in tokens)
+            if not phrases:
+                return []
+            # Se intersecta desde la lista más corta; las frases piden posiciones contiguas
+            lists = [p for phrase in phrases for p in phrase]
+            candidates = sorted(min(lists, key=len))
+            out: List[Hit] = []
+            for doc in candidates:
+                if all(doc in p for p in lists) and all(_contiguous(phrase, doc) for phrase in phrases):
+                    out.append(self.docs[doc])
+                    if len(out) >= limit:
+                        break
+        return out
+
+def _contiguous(phrase: List[Dict[int, List[int]]], doc: int) -> bool:
+    if len(phrase) == 1:
+        return True
+    starts = set(phrase[0][doc])
+    for k, postings in enumerate(phrase[1:], 1):
+        starts &= {pos - k for pos in postings[doc]}
+        if not starts:
+            return False
+    return True
+
+class LogFollower:
+    # Sigue la bitácora desde el último offset leído: cada poll() indexa sólo
+    # lo anexado desde la vez anterior (también lo que escriben otros procesos).
+    def __init__(self, index: TranscriptIndex, url: str):
+        self.index = index
+        self.url = url
+        self.offset = 0
+        self.bad_lines = 0         # líneas rotas de la bitácora, saltadas
+        self._lock = threading.Lock()
+
+    def _bad(self, line: bytes):
+        self.bad_lines += 1
+
+    def poll(self) -> int:
+        with self._lock:
+            events, self.offset = read_events(self.url, self.offset, on_bad=self._bad)
+        return self.index.add_events(events)
@@ -0,0 +1,130 @@
+# Backends de estado compartido: dónde viven los checkpoints para que
+# cualquier proceso del pool pueda retomar una sesión. La interfaz es mínima
+# (get / put_many) para que un Redis local o un sustituto la cumplan.
+#
+#   ruta o sqlite://ruta.sqlite3    → SQLiteBackend
+#   file:///carpeta                 → FileBackend (un .json por token)
+#   redis://host:6379/0             → RedisBackend (requiere el paquete redis)
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Protocol
+
+TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class StateBackend(Protocol):
+    def get(self, token: str) -> Optional[str]: ...
+    def put_many(self, items: Dict[str, str]) -> None: ...
+    def close(self) -> None: ...
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    token   TEXT PRIMARY KEY,
+    state   TEXT NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+class SQLiteBackend:
+    # WAL: lectores de otros procesos no bloquean al escritor
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, token: str) -> Optional[str]:
+        row = self._conn().execute("SELECT state FROM checkpoints WHERE token = ?", (token,)).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items: Dict[str, str]):
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints (token, state, updated) VALUES (?, ?, ?)",
+                [(token, payload, now) for token, payload in items.items()],
+            )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class FileBackend:
+    # Un archivo por token, reemplazado de forma atómica (os.replace)
+    def __init__(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+
+    def _path(self, token: str) -> str:
+        if not TOKEN_RE.match(token):
+            raise ValueError(f"token inválido: {token!r}")
+        return os.path.join(self.folder, token + ".json")
+
+    def get(self, token: str) -> Optional[str]:
+        try:
+            with open(self._path(token), encoding="utf-8") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def put_many(self, items: Dict[str, str]):
+        for token, payload in items.items():
+            fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(payload)
+            os.replace(tmp, self._path(token))
+
+    def close(self):
+        pass
+
+class RedisBackend:
+    # `client` es cualquier objeto con get/pipeline estilo redis-py
+    # (redis.Redis, fakeredis, un sustituto propio); ttl en segundos.
+    def __init__(self, client, prefix: str = "preconsulta:", ttl: int = 7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, token: str) -> Optional[str]:
+        raw = self.client.get(self.prefix + token)
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    def put_many(self, items: Dict[str, str]):
+        pipe = self.client.pipeline()
+        for token, payload in items.items():
+            pipe.set(self.prefix + token, payload, ex=self.ttl)
+        pipe.execute()
+
+    def close(self):
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+
+def open_backend(url: str) -> StateBackend:
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("redis:// requiere el paquete 'redis' (pip install redis)") from exc
+        return RedisBackend(redis.Redis.from_url(url))
+    if url.startswith("file://"):
+        return FileBackend(url[len("file://"):])
+    if url.startswith("sqlite://"):
+        url = url[len("sqlite://"):]
+    return SQLiteBackend(url)
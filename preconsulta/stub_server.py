@@ -0,0 +1,93 @@
+# Servidor de modelo de prueba: responde POST /v1/turn transmitiendo el texto
+# del guion (el campo "fallback") palabra a palabra en NDJSON, con latencias
+# configurables. HTTP/1.1 keep-alive y respuestas chunked, sólo stdlib.
+#
+#   python -m preconsulta.stub_server --port 8765 --first-token 0.4 --delay 0.03
+#   PRECONSULTA_AGENT_URL=http://127.0.0.1:8765 streamlit run app.py
+import argparse
+import asyncio
+import json
+import re
+import sys
+from typing import Optional, Sequence
+
+class StubServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 first_token: float = 0.3, delay: float = 0.03):
+        self.host = host
+        self.port = port
+        self.first_token = first_token
+        self.delay = delay
+        self.requests = 0
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.requests += 1
+                if not request_line.startswith(b"POST ") or b"/v1/turn" not in request_line:
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                    await writer.drain()
+                    continue
+                payload = json.loads(body or b"{}")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n")
+                await asyncio.sleep(self.first_token)
+                for token in re.findall(r"\S+\s*", str(payload.get("fallback", ""))):
+                    data = (json.dumps({"token": token}, ensure_ascii=False) + "\n").encode("utf-8")
+                    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    await writer.drain()
+                    await asyncio.sleep(self.delay)
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m preconsulta.stub_server",
+                                 description="Servidor de modelo de prueba para PRECONSULTA_AGENT_URL.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--first-token", type=float, default=0.3, help="segundos hasta el primer token")
+    ap.add_argument("--delay", type=float, default=0.03, help="segundos entre tokens")
+    args = ap.parse_args(argv)
+
+    async def run():
+        server = StubServer(args.host, args.port, args.first_token, args.delay)
+        port = await server.start()
+        print(f"stub escuchando en http://{args.host}:{port}", file=sys.stderr)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())